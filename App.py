@@ -1,17 +1,29 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 from styles import apply_custom_css
 from utils import (
     get_openai_client,
-    extract_text_from_pdf,
-    generate_quiz_content,
+    extract_pages_from_pdf,
+    open_document,
+    open_workspace,
+    quiz_in_bank,
+    draw_quiz,
     generate_flashcards_content,
     generate_diagram_code,
-    generate_audio_summary,
-    get_chat_response
+    render_diagram,
+    new_audio_owner,
+    stream_chat_response,
+    iter_study_pack,
+    start_precompute,
+    start_quiz_job,
+    start_audio_job,
+    get_job,
+    cancel_job
     # get_youtube_recommendations REMOVED
 )
 import os
 import json
+import uuid
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -28,13 +40,65 @@ if 'page' not in st.session_state:
     st.session_state.page = 'home'
 if 'client' not in st.session_state:
     st.session_state.client = None
-if 'document_text' not in st.session_state:
-    st.session_state.document_text = None
+if 'document' not in st.session_state:
+    # Handle into the shared document store; the text itself is not copied per session
+    st.session_state.document = None
 if 'document_name' not in st.session_state:
     st.session_state.document_name = None
+if 'audio_owner' not in st.session_state:
+    # Audio files are deleted when this handle is released or the session ends
+    st.session_state.audio_owner = new_audio_owner()
+if 'precompute' not in st.session_state:
+    # Background warm-up of likely artefacts, started after an upload
+    st.session_state.precompute = None
+if 'workspace' not in st.session_state:
+    # The user's persistent documents, known once an API key has been entered
+    st.session_state.workspace = None
+if 'session_id' not in st.session_state:
+    # Keeps this session's background jobs apart from the same user's other sessions
+    st.session_state.session_id = uuid.uuid4().hex
+if 'jobs' not in st.session_state:
+    # Tab ("quiz", "audio") -> id of the background job generating its content
+    st.session_state.jobs = {}
+
+# Seconds between progress updates of a running job
+JOB_POLL_SECONDS = 1.0
 
 # --- PAGE FUNCTIONS ---
 
+def open_study_session(client, workspace, pages, name):
+    """Loads a document into this session and switches to the tools page."""
+    document = open_document(pages)
+
+    # Warm up the index, flashcards, quiz bank and summary script in the background
+    if st.session_state.precompute is not None:
+        st.session_state.precompute.cancel()
+    st.session_state.precompute = start_precompute(client, document)
+
+    # Store data in session state and switch page
+    st.session_state.client = client
+    st.session_state.workspace = workspace
+    if st.session_state.document is not None:
+        st.session_state.document.release()
+    st.session_state.document = document
+    st.session_state.document_name = name
+    st.session_state.page = 'tools'
+    st.rerun()
+
+def render_workspace_picker():
+    """Lists the documents already in the user's workspace so they can be reopened."""
+    workspace = st.session_state.workspace
+    documents = workspace.documents() if workspace is not None else []
+    if not documents or st.session_state.client is None:
+        return
+    st.markdown("#### 📚 Your workspace")
+    st.caption("Reopen a document you studied before. No upload or extraction needed.")
+    for doc in documents:
+        col_name, col_open = st.columns([4, 1])
+        col_name.write(f"**{doc['name']}** · {doc['pages']} pages")
+        if col_open.button("Open", key=f"open_{doc['key']}"):
+            open_study_session(st.session_state.client, workspace, workspace.pages(doc['key']), doc['name'])
+
 def render_home_page():
     """Renders the configuration page for API Key and PDF upload."""
     
@@ -63,6 +127,8 @@ def render_home_page():
         st.markdown("<br>", unsafe_allow_html=True) 
         submit_button = st.form_submit_button(label='🚀 Analyze Document', type="primary")
 
+    render_workspace_picker()
+
     # Display settings and instructions in a box
     st.markdown("""
     <div style="padding: 15px; border: 1px solid #DADCE0; border-radius: 8px; margin-top: 30px;">
@@ -97,6 +163,12 @@ def render_home_page():
         if not api_key:
             st.error("Please enter your Groq API Key.")
         elif not uploaded_file:
+            workspace = open_workspace(api_key)
+            if workspace.documents():
+                # Nothing new to analyze, so offer the documents already in the workspace
+                st.session_state.client = get_openai_client(api_key)
+                st.session_state.workspace = workspace
+                st.rerun()
             st.error("Please upload a PDF document.")
         else:
             # Processing logic
@@ -104,24 +176,331 @@ def render_home_page():
                 try:
                     # Need to read the file content twice if st.file_uploader is used
                     uploaded_file.seek(0)
-                    text = extract_text_from_pdf(uploaded_file)
+                    progress_bar = st.progress(0.0, text="Reading pages...")
+                    pages = extract_pages_from_pdf(
+                        uploaded_file,
+                        workers=os.cpu_count(),
+                        progress=lambda done, total: progress_bar.progress(
+                            done / total, text=f"Reading page {done} of {total}..."
+                        ),
+                    )
+                    progress_bar.empty()
                     
                     client = get_openai_client(api_key)
-                    
-                    # Store data in session state and switch page
-                    st.session_state.client = client
-                    st.session_state.document_text = text
-                    st.session_state.document_name = uploaded_file.name
-                    st.session_state.page = 'tools'
-                    st.rerun()
+                    workspace = open_workspace(api_key)
+                    workspace.add(uploaded_file.name, pages)
+                    open_study_session(client, workspace, pages, uploaded_file.name)
                     
                 except Exception as e:
                     st.error(f"Error processing file: {e}")
 
+def rerun_tab():
+    """Reruns only the calling tab's fragment, or the whole app during a full run."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # The fragment is being rendered as part of a full script run
+        st.rerun()
+
+def job_user():
+    """Who a job counts against: the workspace user, or this session before an API key is known."""
+    if st.session_state.workspace is not None:
+        return st.session_state.workspace.user
+    return st.session_state.session_id
+
+def take_finished_job(slot):
+    """Returns the slot's job once it has finished and frees the slot; None while it is still running."""
+    job_id = st.session_state.jobs.get(slot)
+    if job_id is None:
+        return None
+    job = get_job(job_id)
+    if job is None:
+        # Expired from disk; nothing left to show
+        del st.session_state.jobs[slot]
+        return None
+    if not job.finished:
+        return None
+    del st.session_state.jobs[slot]
+    return job
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress(slot):
+    """Polls a running job and reruns the app once it finishes, so its tab can show the result."""
+    job = get_job(st.session_state.jobs.get(slot))
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress_value, text=job.message or "Working...")
+    if job.outputs.get("ttft") is not None:
+        st.caption(f"Script started streaming in {job.outputs['ttft']:.2f}s")
+    preview = job.outputs.get("preview")
+    if preview and os.path.exists(preview):
+        # The first part plays while the rest is still being recorded
+        st.audio(preview, format="audio/mp3")
+    if job.partial:
+        with st.expander("Script", expanded=True):
+            st.write(job.partial)
+    if st.button("Cancel", key=f"{slot}_job_cancel"):
+        cancel_job(job.id)
+        st.rerun()
+
+def cancel_jobs():
+    for job_id in st.session_state.jobs.values():
+        cancel_job(job_id)
+    st.session_state.jobs = {}
+
+def show_quiz(questions):
+    st.session_state.quiz_data = questions
+    st.session_state.current_question = 0
+    st.session_state.score = 0
+    st.session_state.total_questions = len(questions)
+
+@st.fragment
+def render_quiz_tab(client, document):
+    """Renders the Interactive Quiz tab."""
+    col1, col2 = st.columns([1, 2.5])
+    
+    with col1:
+        st.markdown("#### Quiz Configuration")
+        num_q = st.number_input("Number of Questions", 3, 20, 5, key="num_q_input")
+        level = st.select_slider("Difficulty", ["Easy", "Medium", "Hard"], key="level_slider")
+        
+        st.markdown("<br>", unsafe_allow_html=True) 
+        
+        if st.button("✨ Generate Quiz", type="primary", key="generate_quiz_tool_btn"):
+            # Questions already served this session are not drawn again
+            seen = st.session_state.setdefault("quiz_seen", set())
+            if quiz_in_bank(document, num_q, level, seen):
+                # Served from the question bank at once; only generation needs a background job
+                show_quiz(draw_quiz(client, document, num_q, level, seen))
+            else:
+                job = start_quiz_job(client, document, num_q, level, seen, job_user(), st.session_state.session_id)
+                st.session_state.jobs["quiz"] = job.id
+
+        finished = take_finished_job("quiz")
+        if finished is not None:
+            if finished.state == "done":
+                show_quiz(finished.result)
+            elif finished.state == "failed":
+                st.error(f"Error: {finished.error}")
+        if "quiz" in st.session_state.jobs:
+            render_job_progress("quiz")
+
+    with col2:
+        if "quiz_data" in st.session_state and st.session_state.quiz_data:
+            question = st.session_state.quiz_data[0]
+            
+            # Progress
+            q_left = len(st.session_state.quiz_data)
+            total = st.session_state.total_questions
+            current = total - q_left + 1
+            st.caption(f"Question {current} of {total}")
+            st.progress(current / total)
+            
+            # Question Card
+            st.markdown(f"""
+            <div class="question-box">
+                <h3>{question['question']}</h3>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Options (Styled as Cards via CSS)
+            user_answer = st.radio(
+                "Select your answer:", 
+                question['options'], 
+                key=f"q_{current}_radio", 
+                label_visibility="collapsed"
+            )
+            
+            st.markdown("<br>", unsafe_allow_html=True)
+            
+            if st.button("Submit Answer", key=f"q_{current}_submit"):
+                correct_answer = question['answer']
+                if user_answer and (user_answer in correct_answer or correct_answer in user_answer):
+                    st.toast("Correct! 🎉", icon="✅")
+                    st.session_state.score += 1
+                else:
+                    st.toast(f"Wrong! The answer was {correct_answer}", icon="❌")
+                
+                st.session_state.quiz_data.pop(0)
+                rerun_tab()
+
+        elif "quiz_data" in st.session_state and not st.session_state.quiz_data:
+             st.balloons()
+             
+             score = st.session_state.score
+             total = st.session_state.total_questions
+             percentage = (score / total) * 100 if total > 0 else 0
+             
+             # Determine feedback based on score
+             if percentage >= 80:
+                 feedback_emoji = "🧠"
+                 feedback_text = "Excellent! You've mastered these concepts."
+                 color = "#10B981" # Green
+             elif percentage >= 50:
+                 feedback_emoji = "💪"
+                 feedback_text = "Good job! A little more practice will get you there."
+                 color = "#F59E0B" # Yellow/Orange
+             else:
+                 feedback_emoji = "📚"
+                 feedback_text = "Keep studying! Reviewing the flashcards will help."
+                 color = "#EF4444" # Red
+                 
+             # NEW: Improved Score Display using Streamlit's built-in metric and custom styling
+             st.markdown(f"""
+             <div style="text-align: center; padding: 50px; background: white; border-radius: 16px; border: 1px solid #E2E8F0; box-shadow: 0 4px 6px -1px rgba(0,0,0,0.05);">
+                <h2 style="color: {color}; margin-top: 0;">{feedback_emoji} Quiz Complete!</h2>
+                
+                <div style="margin-top: 20px; display: flex; justify-content: center; align-items: baseline; gap: 20px;">
+                    <div style="font-size: 4rem; font-weight: 700; color: #1F2937;">
+                        {score} / {total}
+                    </div>
+                    <div style="font-size: 2rem; color: {color}; font-weight: 500;">
+                        ({percentage:.0f}%)
+                    </div>
+                </div>
+                
+                <p style="font-size: 1.2rem; color: #475569; margin-top: 10px;">{feedback_text}</p>
+             </div>
+             """, unsafe_allow_html=True)
+             
+             st.markdown("<br>", unsafe_allow_html=True)
+             
+             if st.button("Start New Quiz", key="new_quiz_btn"):
+                 del st.session_state.quiz_data
+                 rerun_tab()
+
+        else:
+            st.markdown("""
+            <div style="display: flex; flex-direction: column; align-items: center; justify-content: center; height: 300px; border: 2px dashed #DADCE0; border-radius: 16px; color: #9AA0A6;">
+                <div style="font-size: 3rem; margin-bottom: 10px;">👈</div>
+                <p style="font-weight: 500;">Configure and generate a quiz from the left panel.</p>
+            </div>
+            """, unsafe_allow_html=True)
+
+@st.fragment
+def render_flashcards_tab(client, text):
+    """Renders the Flashcards tab."""
+    precomputed = st.session_state.precompute
+    if "flashcards" not in st.session_state and precomputed is not None:
+        ready = precomputed.result("flashcards")
+        if ready:
+            st.session_state.flashcards = ready
+
+    if st.button("⚡ Generate Flashcards", key="flashcard_gen_btn"):
+        with st.spinner("Extracting concepts..."):
+            try:
+                flashcards_data = generate_flashcards_content(client, text)
+                st.session_state.flashcards = flashcards_data
+                
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    if "flashcards" in st.session_state:
+        st.markdown("<br>", unsafe_allow_html=True)
+        for card in st.session_state.flashcards:
+            # Styled Flashcard
+            with st.expander(f"📌 {card.get('concept', 'Term')}"):
+                st.markdown(f"""
+                <div style="padding: 10px; color: #5F6368;">
+                    {card.get('definition', 'Definition')}
+                </div>
+                """, unsafe_allow_html=True)
+
+@st.fragment
+def render_diagram_tab(client, text):
+    """Renders the Mind Map tab."""
+    st.markdown("### 🧠 Visual Knowledge Graph")
+    if st.button("Generate Diagram", key="diagram_gen_btn"):
+        with st.spinner("Visualizing relationships..."):
+            try:
+                dot_code = generate_diagram_code(client, text)
+                st.session_state.diagram = dot_code
+            except Exception as e: st.error(e)
+
+    if "diagram" in st.session_state:
+        # Laid out once on the server and cached by DOT hash; the browser only draws the SVG
+        svg = render_diagram(st.session_state.diagram)
+        if svg:
+            st.image(svg)
+        else:
+            st.graphviz_chart(st.session_state.diagram)
+
+@st.fragment
+def render_audio_tab(client, document):
+    """Renders the Audio Summary tab."""
+    precomputed = st.session_state.precompute
+    st.markdown("### 🎧 Podcast Mode")
+    minutes = st.select_slider("Length (minutes)", [1, 2, 3, 5], value=2, key="audio_minutes")
+    if st.button("Generate Audio Summary", key="audio_gen_btn"):
+        ready = precomputed.result("audio_script") if precomputed is not None else None
+        # A script written in the background after the upload only needs recording
+        script = ready[1] if ready and ready[0] == minutes else None
+        job = start_audio_job(
+            client, document, minutes, st.session_state.audio_owner, job_user(), script=script
+        )
+        st.session_state.jobs["audio"] = job.id
+
+    finished = take_finished_job("audio")
+    if finished is not None:
+        if finished.state == "done":
+            st.session_state.audio_path, st.session_state.audio_script = finished.result
+            st.session_state.audio_ttft = finished.outputs.get("ttft")
+        elif finished.state == "failed":
+            st.error(finished.error)
+    if "audio" in st.session_state.jobs:
+        render_job_progress("audio")
+
+    if "audio_path" in st.session_state:
+        if os.path.exists(st.session_state.audio_path):
+            st.audio(st.session_state.audio_path)
+        else:
+            st.info("This recording was cleaned up to free space. Generate it again to listen.")
+        with st.expander("View Script"):
+            st.write(st.session_state.audio_script)
+        if st.session_state.get("audio_ttft") is not None:
+            st.caption(f"Script started streaming in {st.session_state.audio_ttft:.2f}s")
+
+@st.fragment
+def render_chat_tab(client, text, document):
+    """Renders the AI Tutor tab."""
+    st.markdown("### 💬 Ask your AI Tutor")
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = []
+
+    workspace = st.session_state.workspace
+    search_all = False
+    if workspace is not None and len(workspace.documents()) > 1:
+        search_all = st.toggle(
+            "Search all my documents", value=True, key="chat_search_all",
+            help="Answer from every document in your workspace, not just this one."
+        )
+
+    for msg in st.session_state.chat_history:
+        st.chat_message(msg["role"]).write(msg["content"])
+
+    if input_text := st.chat_input("Ask about your document...", key="chat_input_tool"):
+        st.session_state.chat_history.append({"role": "user", "content": input_text})
+        st.chat_message("user").write(input_text)
+        
+        with st.chat_message("assistant"):
+            try:
+                stats = {}
+                reply = st.write_stream(stream_chat_response(
+                    client, text, input_text, index=document.index, stats=stats,
+                    workspace=workspace if search_all else None
+                ))
+                st.session_state.chat_history.append({"role": "assistant", "content": reply})
+                if "ttft" in stats:
+                    st.session_state.chat_ttft = stats["ttft"]
+                    st.caption(f"First token in {stats['ttft']:.2f}s")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
 def render_tools_page():
     """Renders the main study tools and tabs."""
     client = st.session_state.client
-    text = st.session_state.document_text
+    document = st.session_state.document
+    text = document.text
     doc_name = st.session_state.document_name
 
     # --- TOP HEADER AND HOME BUTTON ---
@@ -134,14 +513,55 @@ def render_tools_page():
         # Button to go back to the home page (clears core data)
         if st.button("🏠 New Document", key="home_btn", type="secondary"):
             st.session_state.page = 'home'
-            st.session_state.client = None
-            st.session_state.document_text = None
+            # The client and workspace stay, so earlier documents can be reopened from the home page
+            st.session_state.document.release()
+            st.session_state.document = None
             st.session_state.document_name = None
+            st.session_state.audio_owner.release()
+            st.session_state.audio_owner = new_audio_owner()
+            if st.session_state.precompute is not None:
+                st.session_state.precompute.cancel()
+                st.session_state.precompute = None
+            cancel_jobs()
             # Clear study specific keys
-            for key in ["quiz_data", "flashcards", "diagram", "audio_path", "chat_history"]:
+            for key in ["quiz_data", "quiz_seen", "flashcards", "diagram", "audio_path", "chat_history"]:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
+
+    # --- GENERATE EVERYTHING ---
+    if st.button("🚀 Generate Full Study Pack", key="study_pack_btn"):
+        labels = {"quiz": "Quiz", "flashcards": "Flashcards", "diagram": "Mind map", "audio": "Audio summary"}
+        with st.status("Generating quiz, flashcards, mind map and audio...", expanded=True) as status:
+            failed = False
+            for name, result, error in iter_study_pack(
+                client, text,
+                st.session_state.get("num_q_input", 5),
+                st.session_state.get("level_slider", "Easy"),
+                owner=st.session_state.audio_owner
+            ):
+                if error is not None:
+                    failed = True
+                    st.write(f"❌ {labels[name]}: {error}")
+                    continue
+                if name == "quiz":
+                    st.session_state.quiz_data = result
+                    st.session_state.current_question = 0
+                    st.session_state.score = 0
+                    st.session_state.total_questions = len(result)
+                elif name == "flashcards":
+                    st.session_state.flashcards = result
+                elif name == "diagram":
+                    st.session_state.diagram = result
+                elif name == "audio":
+                    st.session_state.audio_path, st.session_state.audio_script = result
+                st.write(f"✅ {labels[name]} ready")
+            if failed:
+                status.update(label="Study pack finished with errors", state="error")
+            else:
+                status.update(label="Study pack ready!", state="complete")
+        if not failed:
+            st.rerun()
     
     # --- TABS ---
     # Removed "📺 Related Videos" tab
@@ -154,194 +574,25 @@ def render_tools_page():
     ])
 
     # --- TAB 1: INTERACTIVE QUIZ ---
+    # Each tab is a fragment, so its own interactions rerun only that tab.
     with tab1:
-        col1, col2 = st.columns([1, 2.5])
-        
-        with col1:
-            st.markdown("#### Quiz Configuration")
-            num_q = st.number_input("Number of Questions", 3, 10, 5, key="num_q_input")
-            level = st.select_slider("Difficulty", ["Easy", "Medium", "Hard"], key="level_slider")
-            
-            st.markdown("<br>", unsafe_allow_html=True) 
-            
-            if st.button("✨ Generate Quiz", type="primary", key="generate_quiz_tool_btn"):
-                with st.spinner("Analyzing content..."):
-                    try:
-                        quiz_data = generate_quiz_content(client, text, num_q, level)
-                        
-                        st.session_state.quiz_data = quiz_data
-                        st.session_state.current_question = 0
-                        st.session_state.score = 0
-                        st.session_state.total_questions = len(st.session_state.quiz_data)
-                        st.rerun()
-                        
-                    except Exception as e:
-                        st.error(f"Error: {e}")
-
-        with col2:
-            if "quiz_data" in st.session_state and st.session_state.quiz_data:
-                question = st.session_state.quiz_data[0]
-                
-                # Progress
-                q_left = len(st.session_state.quiz_data)
-                total = st.session_state.total_questions
-                current = total - q_left + 1
-                st.caption(f"Question {current} of {total}")
-                st.progress(current / total)
-                
-                # Question Card
-                st.markdown(f"""
-                <div class="question-box">
-                    <h3>{question['question']}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Options (Styled as Cards via CSS)
-                user_answer = st.radio(
-                    "Select your answer:", 
-                    question['options'], 
-                    key=f"q_{current}_radio", 
-                    label_visibility="collapsed"
-                )
-                
-                st.markdown("<br>", unsafe_allow_html=True)
-                
-                if st.button("Submit Answer", key=f"q_{current}_submit"):
-                    correct_answer = question['answer']
-                    if user_answer and (user_answer in correct_answer or correct_answer in user_answer):
-                        st.toast("Correct! 🎉", icon="✅")
-                        st.session_state.score += 1
-                    else:
-                        st.toast(f"Wrong! The answer was {correct_answer}", icon="❌")
-                    
-                    st.session_state.quiz_data.pop(0)
-                    st.rerun()
-
-            elif "quiz_data" in st.session_state and not st.session_state.quiz_data:
-                 st.balloons()
-                 
-                 score = st.session_state.score
-                 total = st.session_state.total_questions
-                 percentage = (score / total) * 100 if total > 0 else 0
-                 
-                 # Determine feedback based on score
-                 if percentage >= 80:
-                     feedback_emoji = "🧠"
-                     feedback_text = "Excellent! You've mastered these concepts."
-                     color = "#10B981" # Green
-                 elif percentage >= 50:
-                     feedback_emoji = "💪"
-                     feedback_text = "Good job! A little more practice will get you there."
-                     color = "#F59E0B" # Yellow/Orange
-                 else:
-                     feedback_emoji = "📚"
-                     feedback_text = "Keep studying! Reviewing the flashcards will help."
-                     color = "#EF4444" # Red
-                     
-                 # NEW: Improved Score Display using Streamlit's built-in metric and custom styling
-                 st.markdown(f"""
-                 <div style="text-align: center; padding: 50px; background: white; border-radius: 16px; border: 1px solid #E2E8F0; box-shadow: 0 4px 6px -1px rgba(0,0,0,0.05);">
-                    <h2 style="color: {color}; margin-top: 0;">{feedback_emoji} Quiz Complete!</h2>
-                    
-                    <div style="margin-top: 20px; display: flex; justify-content: center; align-items: baseline; gap: 20px;">
-                        <div style="font-size: 4rem; font-weight: 700; color: #1F2937;">
-                            {score} / {total}
-                        </div>
-                        <div style="font-size: 2rem; color: {color}; font-weight: 500;">
-                            ({percentage:.0f}%)
-                        </div>
-                    </div>
-                    
-                    <p style="font-size: 1.2rem; color: #475569; margin-top: 10px;">{feedback_text}</p>
-                 </div>
-                 """, unsafe_allow_html=True)
-                 
-                 st.markdown("<br>", unsafe_allow_html=True)
-                 
-                 if st.button("Start New Quiz", key="new_quiz_btn"):
-                     del st.session_state.quiz_data
-                     st.rerun()
-
-            else:
-                st.markdown("""
-                <div style="display: flex; flex-direction: column; align-items: center; justify-content: center; height: 300px; border: 2px dashed #DADCE0; border-radius: 16px; color: #9AA0A6;">
-                    <div style="font-size: 3rem; margin-bottom: 10px;">👈</div>
-                    <p style="font-weight: 500;">Configure and generate a quiz from the left panel.</p>
-                </div>
-                """, unsafe_allow_html=True)
+        render_quiz_tab(client, document)
 
     # --- TAB 2: FLASHCARDS ---
     with tab2:
-        if st.button("⚡ Generate Flashcards", key="flashcard_gen_btn"):
-            with st.spinner("Extracting concepts..."):
-                try:
-                    flashcards_data = generate_flashcards_content(client, text)
-                    st.session_state.flashcards = flashcards_data
-                    
-                except Exception as e:
-                    st.error(f"Error: {e}")
-
-        if "flashcards" in st.session_state:
-            st.markdown("<br>", unsafe_allow_html=True)
-            for card in st.session_state.flashcards:
-                # Styled Flashcard
-                with st.expander(f"📌 {card.get('concept', 'Term')}"):
-                    st.markdown(f"""
-                    <div style="padding: 10px; color: #5F6368;">
-                        {card.get('definition', 'Definition')}
-                    </div>
-                    """, unsafe_allow_html=True)
+        render_flashcards_tab(client, text)
 
     # --- TAB 3: MIND MAP ---
     with tab3:
-        st.markdown("### 🧠 Visual Knowledge Graph")
-        if st.button("Generate Diagram", key="diagram_gen_btn"):
-            with st.spinner("Visualizing relationships..."):
-                try:
-                    dot_code = generate_diagram_code(client, text)
-                    st.session_state.diagram = dot_code
-                except Exception as e: st.error(e)
-
-        if "diagram" in st.session_state:
-            st.graphviz_chart(st.session_state.diagram)
+        render_diagram_tab(client, text)
 
     # --- TAB 4: AUDIO SUMMARY ---
     with tab4:
-        st.markdown("### 🎧 Podcast Mode")
-        if st.button("Generate Audio Summary", key="audio_gen_btn"):
-            with st.spinner("Writing script & recording..."):
-                try:
-                    audio_path, summary_text = generate_audio_summary(client, text)
-                    st.session_state.audio_path = audio_path
-                    st.session_state.audio_script = summary_text
-                        
-                except Exception as e: st.error(e)
-
-        if "audio_path" in st.session_state:
-            st.audio(st.session_state.audio_path)
-            with st.expander("View Script"):
-                st.write(st.session_state.audio_script)
+        render_audio_tab(client, document)
 
     # --- TAB 5: CHAT ---
     with tab5:
-        st.markdown("### 💬 Ask your AI Tutor")
-        if "chat_history" not in st.session_state:
-            st.session_state.chat_history = []
-
-        for msg in st.session_state.chat_history:
-            st.chat_message(msg["role"]).write(msg["content"])
-
-        if input_text := st.chat_input("Ask about your document...", key="chat_input_tool"):
-            st.session_state.chat_history.append({"role": "user", "content": input_text})
-            st.chat_message("user").write(input_text)
-            
-            with st.chat_message("assistant"):
-                try:
-                    reply = get_chat_response(client, text, input_text)
-                    st.write(reply)
-                    st.session_state.chat_history.append({"role": "assistant", "content": reply})
-                except Exception as e:
-                    st.error(f"Error: {e}")
+        render_chat_tab(client, text, document)
 
     # --- TAB 6: RELATED VIDEOS --- (DELETED)
     # The logic for Tab 6 is entirely removed as requested.
@@ -354,7 +605,7 @@ if st.session_state.page == 'home':
     render_home_page()
 elif st.session_state.page == 'tools':
     # Only render tools if the required data is present
-    if st.session_state.client and st.session_state.document_text:
+    if st.session_state.client and st.session_state.document:
         render_tools_page()
     else:
         # Fallback if somehow they landed here without data
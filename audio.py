@@ -0,0 +1,152 @@
+import atexit
+import io
+import os
+import re
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_cache import CACHE_DIR
+
+
+AUDIO_DIR = os.path.join(CACHE_DIR, "audio")
+AUDIO_LIMIT_BYTES = int(os.environ.get("COGNIFAST_AUDIO_BYTES", 256 * 1024 * 1024))
+SEGMENT_CHARS = 400
+FIRST_SEGMENT_CHARS = 160
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text, max_chars=SEGMENT_CHARS, first_chars=FIRST_SEGMENT_CHARS):
+    """Groups sentences into TTS segments; the first one is kept short so it plays sooner."""
+    segments, current = [], ""
+    limit = first_chars
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > limit:
+            segments.append(current)
+            current = ""
+            limit = max_chars
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+class GTTSBackend:
+    """Google Translate TTS (needs network access)."""
+
+    def __init__(self, lang="en", tld="co.uk"):
+        self.lang = lang
+        self.tld = tld
+
+    def synthesize(self, text):
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=self.lang, tld=self.tld).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class SilentBackend:
+    """Offline stand-in that emits silent MP3 frames, roughly one second per 15 characters."""
+
+    # One MPEG-1 Layer III frame, 128 kbps / 44.1 kHz, with an all-zero payload.
+    _FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+    _FRAMES_PER_SECOND = 38
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def synthesize(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        seconds = max(1, len(text) // 15)
+        return self._FRAME * (seconds * self._FRAMES_PER_SECOND)
+
+
+class AudioOwner:
+    """Handle tying audio files to a session; its files are released when it is collected."""
+
+    def __init__(self, store):
+        self.id = uuid.uuid4().hex
+        self._finalizer = weakref.finalize(self, store.release, self.id)
+
+    def release(self):
+        self._finalizer()
+
+
+class AudioStore:
+    """Size-capped directory of audio artefacts, evicted oldest first and released per owner."""
+
+    def __init__(self, directory=AUDIO_DIR, max_bytes=AUDIO_LIMIT_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = OrderedDict()  # path -> (owner, size)
+        self._lock = threading.Lock()
+        self._total = 0
+
+    def new_owner(self):
+        return AudioOwner(self)
+
+    def save(self, data, owner=None, suffix=".mp3"):
+        """Writes data to a new file in the store and returns its path."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}{suffix}")
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._files[path] = (owner, len(data))
+            self._total += len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._files) > 1:
+            path, (_, size) = self._files.popitem(last=False)
+            self._total -= size
+            self._remove(path)
+
+    def release(self, owner):
+        """Deletes every file that belongs to owner."""
+        with self._lock:
+            paths = [p for p, (o, _) in self._files.items() if o == owner]
+            for path in paths:
+                self._total -= self._files.pop(path)[1]
+                self._remove(path)
+
+    def clear(self):
+        with self._lock:
+            for path in self._files:
+                self._remove(path)
+            self._files.clear()
+            self._total = 0
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+def synthesize_segments(script, backend, max_workers=4):
+    """Synthesises sentence segments concurrently and yields their audio bytes in order."""
+    segments = split_sentences(script)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(backend.synthesize, segment) for segment in segments]
+        for future in futures:
+            yield future.result()
+
+
+default_backend = GTTSBackend()
+default_store = AudioStore()
+atexit.register(default_store.clear)
@@ -0,0 +1,235 @@
+"""Headless study-pack generation for a directory of PDFs.
+
+Extracts every PDF on a process pool, then generates the quiz, flashcards, mind
+map and audio summary with a bounded number of concurrent LLM calls. Each
+artefact is written as soon as it is ready and recorded in a per-document
+manifest, so an interrupted run picks up where it stopped:
+
+    python batch.py course_pdfs/ study_packs/ --llm-concurrency 8
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import utils
+from text_prep import prepare
+
+
+ARTEFACTS = ("quiz", "flashcards", "diagram", "summary")
+MANIFEST = "manifest.json"
+
+
+def find_pdfs(directory):
+    """Returns every PDF under directory, sorted for a stable processing order."""
+    found = []
+    for root, _, files in os.walk(directory):
+        found.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+    return sorted(found)
+
+
+def output_dir_for(pdf_path, input_dir, output_dir):
+    relative = os.path.splitext(os.path.relpath(pdf_path, input_dir))[0]
+    return os.path.join(output_dir, relative.replace(os.sep, "__"))
+
+
+def _source_stamp(pdf_path):
+    st = os.stat(pdf_path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_json(path, value):
+    _write_atomic(path, json.dumps(value, indent=2, ensure_ascii=False).encode("utf-8"))
+
+
+class Manifest:
+    """Which artefacts of one document are complete, persisted after every change."""
+
+    def __init__(self, directory, source):
+        self.path = os.path.join(directory, MANIFEST)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("source") != source:
+            data = {"source": source, "done": {}, "errors": {}}  # New or changed PDF
+        self.data = data
+
+    def pending(self, artefacts):
+        return [a for a in artefacts if a not in self.data["done"]]
+
+    def mark(self, artefact, files=None, error=None):
+        with self._lock:
+            if error is None:
+                self.data["done"][artefact] = files
+                self.data["errors"].pop(artefact, None)
+            else:
+                self.data["errors"][artefact] = error
+            _write_json(self.path, self.data)
+
+
+def _extract(pdf_path):
+    # One document per process; parallelism comes from the pool, not per-page workers.
+    return utils.extract_pages_from_pdf(pdf_path, workers=1)
+
+
+def _generate(client, artefact, text, directory, args):
+    """Produces one artefact and returns the files it wrote."""
+    if artefact == "quiz":
+        path = os.path.join(directory, "quiz.json")
+        _write_json(path, utils.generate_quiz_content(client, text, args.questions, args.level))
+        return [path]
+    if artefact == "flashcards":
+        path = os.path.join(directory, "flashcards.json")
+        _write_json(path, utils.generate_flashcards_content(client, text))
+        return [path]
+    if artefact == "diagram":
+        dot = utils.generate_diagram_code(client, text)
+        files = [os.path.join(directory, "diagram.json")]
+        _write_json(files[0], {"dot": dot})
+        svg = utils.render_diagram(dot)
+        if svg:
+            files.append(os.path.join(directory, "diagram.svg"))
+            _write_atomic(files[1], svg.encode("utf-8"))
+        return files
+    if artefact == "summary":
+        # One call at a time, so --llm-concurrency bounds the LLM calls and not only the artefacts
+        script = utils.generate_audio_script(client, text, mode="map_reduce", minutes=args.minutes, max_workers=1)
+        files = [os.path.join(directory, "summary.json")]
+        _write_json(files[0], {"minutes": args.minutes, "script": script})
+        if not args.no_audio:
+            owner = utils.new_audio_owner()
+            try:
+                audio_path = utils.synthesize_audio(script, owner=owner)
+                files.append(os.path.join(directory, "summary.mp3"))
+                shutil.copyfile(audio_path, files[1])
+            finally:
+                owner.release()
+        return files
+    raise ValueError(f"unknown artefact {artefact!r}")
+
+
+def run(args):
+    client = utils.get_openai_client(args.api_key, base_url=args.base_url)
+    pdfs = find_pdfs(args.input_dir)
+    artefacts = [a for a in ARTEFACTS if a not in args.skip]
+    started = time.perf_counter()
+    report = {"documents": len(pdfs), "completed": 0, "skipped": 0, "failed": 0, "errors": {}}
+
+    jobs = []
+    for pdf in pdfs:
+        directory = output_dir_for(pdf, args.input_dir, args.output_dir)
+        os.makedirs(directory, exist_ok=True)
+        manifest = Manifest(directory, _source_stamp(pdf))
+        pending = manifest.pending(artefacts)
+        if pending:
+            jobs.append((pdf, directory, manifest, pending))
+        else:
+            report["skipped"] += 1
+    print(f"{len(pdfs)} PDFs, {report['skipped']} already complete, {len(jobs)} to process")
+
+    remaining = {}  # pdf -> artefacts still running
+    failed = set()
+    lock = threading.Lock()
+
+    def finish(pdf, artefact, error):
+        with lock:
+            if error is not None:
+                failed.add(pdf)
+                report["errors"].setdefault(os.path.relpath(pdf, args.input_dir), {})[artefact] = error
+            remaining[pdf].discard(artefact)
+            if remaining[pdf]:
+                return
+            if pdf in failed:
+                report["failed"] += 1
+            else:
+                report["completed"] += 1
+            done = report["completed"] + report["failed"]
+            minutes = (time.perf_counter() - started) / 60
+            print(
+                f"[{done}/{len(jobs)}] {'FAILED' if pdf in failed else 'done'} "
+                f"{os.path.relpath(pdf, args.input_dir)} ({report['completed'] / minutes:.2f} docs/min)"
+            )
+
+    def generate(pdf, directory, manifest, artefact, text):
+        try:
+            files = _generate(client, artefact, text, directory, args)
+        except Exception as e:
+            manifest.mark(artefact, error=f"{type(e).__name__}: {e}")
+            finish(pdf, artefact, str(e))
+        else:
+            manifest.mark(artefact, files=[os.path.basename(f) for f in files])
+            finish(pdf, artefact, None)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as extractors, \
+            ThreadPoolExecutor(max_workers=args.llm_concurrency) as generators:
+        extractions = {extractors.submit(_extract, job[0]): job for job in jobs}
+        for future in as_completed(extractions):
+            pdf, directory, manifest, pending = extractions[future]
+            remaining[pdf] = set(pending)
+            try:
+                pages = future.result()
+            except Exception as e:
+                for artefact in pending:
+                    manifest.mark(artefact, error=f"extraction: {e}")
+                    finish(pdf, artefact, f"extraction: {e}")
+                continue
+            text = "".join(pages)
+            prepare(text, pages)  # Page-aware compaction, reused by every prompt below
+            for artefact in pending:
+                generators.submit(generate, pdf, directory, manifest, artefact, text)
+
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 2)
+    report["docs_per_minute"] = round(report["completed"] / (elapsed / 60), 2) if elapsed else 0.0
+    _write_json(os.path.join(args.output_dir, "batch_report.json"), report)
+    print(
+        f"Completed {report['completed']}, failed {report['failed']}, skipped {report['skipped']} "
+        f"in {elapsed:.1f}s ({report['docs_per_minute']:.2f} docs/min)"
+    )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate study packs for a directory of PDFs.")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--api-key", default=os.environ.get("GROQ_API_KEY"), help="Defaults to $GROQ_API_KEY.")
+    parser.add_argument("--base-url", default=utils.GROQ_BASE_URL)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes.")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="Concurrent artefact generations.")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--level", default="Medium", choices=["Easy", "Medium", "Hard"])
+    parser.add_argument("--minutes", type=int, default=2, help="Audio summary length.")
+    parser.add_argument("--skip", nargs="*", default=[], choices=ARTEFACTS, help="Artefacts not to generate.")
+    parser.add_argument("--no-audio", action="store_true", help="Write the summary script without the MP3.")
+    args = parser.parse_args(argv)
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or $GROQ_API_KEY)")
+
+    report = run(args)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
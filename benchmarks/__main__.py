@@ -0,0 +1,5 @@
+# Entry point lives here so the benchmark functions are importable as benchmarks.run
+# in worker processes, even after AppTest replaces __main__ with App.py.
+from benchmarks.run import main
+
+main()
@@ -0,0 +1,80 @@
+"""Generates synthetic lecture-note PDFs of a given page count, with no extra dependencies."""
+import os
+import random
+
+
+_WORDS = (
+    "algorithm memory cache processor pipeline register instruction branch latency "
+    "throughput bandwidth thread process kernel scheduler interrupt virtual page table "
+    "network packet protocol router database index query transaction lock commit "
+    "compiler parser grammar token optimisation loop vector matrix gradient model"
+).split()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(page_no, rng, lines=40):
+    yield "Course Pack - Computer Systems"
+    for i in range(lines):
+        words = rng.choices(_WORDS, k=rng.randint(8, 14))
+        yield f"{page_no}.{i} " + " ".join(words).capitalize() + "."
+    yield str(page_no)
+
+
+def make_pdf(pages, seed=0):
+    """Returns the bytes of a text PDF with the requested number of pages."""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page_no in range(1, pages + 1):
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        for line in _page_lines(page_no, rng):
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (page_tree, font, content)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, xref
+    )
+    return bytes(out)
+
+
+def build_corpus(directory, sizes=(10, 50, 200)):
+    """Writes one PDF per page count into directory and returns {pages: path}."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for pages in sizes:
+        path = os.path.join(directory, f"corpus_{pages}p.pdf")
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(make_pdf(pages, seed=pages))
+        paths[pages] = path
+    return paths
@@ -0,0 +1,386 @@
+"""Offline benchmark suite for utils.py and App.py.
+
+Runs every generator and the PDF extractor against a local stub server and a
+generated PDF corpus, then drives end-to-end Streamlit sessions through AppTest.
+Run from the repository root:
+
+    python -m benchmarks --output bench.json
+    python -m benchmarks --compare bench.json
+"""
+import argparse
+import dataclasses
+import functools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Benchmarks must never be throttled by, or served from, the production caches.
+os.environ.setdefault("COGNIFAST_RPM", "1000000")
+os.environ.setdefault("COGNIFAST_TPM", "1000000000")
+os.environ.setdefault("COGNIFAST_LLM_CACHE", "off")
+os.environ.setdefault("COGNIFAST_CACHE_DIR", tempfile.mkdtemp(prefix="cognifast_bench_"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import audio  # noqa: E402
+import utils  # noqa: E402
+from benchmarks.corpus import build_corpus  # noqa: E402
+from benchmarks.stub_server import StubConfig, StubServer  # noqa: E402
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        return None, repr(e)
+    return time.perf_counter() - started, None
+
+
+def _peak_memory(fn):
+    """Peak Python heap allocated during one extra, traced call (kept out of the timings)."""
+    tracemalloc.start()
+    try:
+        fn()
+    except Exception:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure(name, fn, iterations, concurrency=1, processes=False, **params):
+    """Calls fn() iterations times with the given concurrency and summarises the run.
+
+    ``processes=True`` runs each call in its own worker process (fn must be picklable).
+    """
+    pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_cls(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        outcomes = list(pool.map(_timed, [fn] * iterations))
+        wall = time.perf_counter() - started
+        peak = pool.submit(_peak_memory, fn).result()
+    latencies = [t for t, _ in outcomes if t is not None]
+    errors = [e for _, e in outcomes if e is not None]
+
+    result = {
+        "name": name,
+        "params": dict(params, iterations=iterations, concurrency=concurrency),
+        "ok": len(latencies),
+        "errors": len(errors),
+        "throughput_per_s": len(latencies) / wall if wall else 0.0,
+        "peak_mem_bytes": peak,
+    }
+    if latencies:
+        result.update({
+            "mean_s": statistics.fmean(latencies),
+            "p50_s": percentile(latencies, 50),
+            "p95_s": percentile(latencies, 95),
+            "p99_s": percentile(latencies, 99),
+        })
+    if errors:
+        result["first_error"] = errors[0]
+    print(
+        f"{name:<30} {json.dumps(params, sort_keys=True):<28} c={concurrency:<3} "
+        f"p50={result.get('p50_s', 0):.3f}s p95={result.get('p95_s', 0):.3f}s "
+        f"p99={result.get('p99_s', 0):.3f}s thr={result['throughput_per_s']:.2f}/s "
+        f"peak={peak / 1e6:.1f}MB err={len(errors)}"
+    )
+    return result
+
+
+def bench_extraction(corpus, iterations, workers):
+    results = []
+    for pages, path in sorted(corpus.items()):
+        results.append(measure(
+            "extract_text_from_pdf", lambda: utils.extract_text_from_pdf(path, cache=None),
+            iterations, pages=pages, workers=1,
+        ))
+        if workers > 1:
+            results.append(measure(
+                "extract_text_from_pdf",
+                lambda: utils.extract_text_from_pdf(path, cache=None, workers=workers),
+                iterations, pages=pages, workers=workers,
+            ))
+    return results
+
+
+def bench_generators(client, text, iterations, concurrency_levels):
+    calls = {
+        "generate_quiz_content": lambda: utils.generate_quiz_content(client, text, 5, "Medium", use_cache=False),
+        "generate_flashcards_content": lambda: utils.generate_flashcards_content(client, text, use_cache=False),
+        "generate_diagram_code": lambda: utils.generate_diagram_code(client, text, use_cache=False),
+        "generate_audio_summary": lambda: utils.generate_audio_summary(client, text, use_cache=False),
+        "get_chat_response": lambda: utils.get_chat_response(client, text, "What is a cache?"),
+        "stream_chat_response": lambda: "".join(utils.stream_chat_response(client, text, "What is a cache?")),
+    }
+    return [
+        measure(name, fn, iterations, concurrency)
+        for concurrency in concurrency_levels
+        for name, fn in calls.items()
+    ]
+
+
+def wait_for_jobs(at, timeout=120):
+    """Waits for the session's background jobs, then reruns so their tabs show the results."""
+    pending = list(at.session_state["jobs"].values()) if "jobs" in at.session_state else []
+    if not pending:
+        return
+    deadline = time.monotonic() + timeout
+    # A job that is no longer known has expired; there is nothing left to wait for
+    while not all(getattr(utils.get_job(job_id), "finished", True) for job_id in pending):
+        if time.monotonic() > deadline:
+            raise TimeoutError("background jobs did not finish")
+        time.sleep(0.05)
+    at.run()
+
+
+def run_session(base_url, text, timeout=120):
+    """One full tools-page session (every tab's main action) through AppTest."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "App.py"), default_timeout=timeout)
+    at.session_state["page"] = "tools"
+    at.session_state["client"] = utils.get_openai_client("benchmark", base_url=base_url)
+    at.session_state["document"] = utils.open_document([text])
+    at.session_state["document_name"] = "benchmark.pdf"
+    at.run()
+    for key in ("generate_quiz_tool_btn", "flashcard_gen_btn", "diagram_gen_btn", "audio_gen_btn"):
+        at.button(key=key).click().run()
+        wait_for_jobs(at)
+    at.chat_input(key="chat_input_tool").set_value("What is a cache?").run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+
+def bench_sessions(base_url, text, concurrency_levels):
+    # AppTest keeps process-global runtime state, so concurrent sessions use processes.
+    session = functools.partial(run_session, base_url, text)
+    return [
+        measure("apptest_session", session, concurrency * 2, concurrency, processes=True)
+        for concurrency in concurrency_levels
+    ]
+
+
+# Interactions replayed by profile_interactions, in order; later ones run with every tab populated.
+# Each is (name, widget getter, value to set or None to click).
+INTERACTIONS = (
+    ("load", None, None),
+    ("generate_quiz", lambda at: at.button(key="generate_quiz_tool_btn"), None),
+    ("flashcards", lambda at: at.button(key="flashcard_gen_btn"), None),
+    ("diagram", lambda at: at.button(key="diagram_gen_btn"), None),
+    ("chat", lambda at: at.chat_input(key="chat_input_tool"), "What is a cache?"),
+    ("answer_question", lambda at: at.button(key="q_1_submit"), None),
+    ("chat_followup", lambda at: at.chat_input(key="chat_input_tool"), "And an index?"),
+)
+
+
+def _instrument_runner(meter):
+    """Meters what AppTest's script runner would send over the websocket.
+
+    Also records which fragment rendered each widget, so an interaction can be
+    replayed the way the browser sends it: as a rerun of that fragment only.
+    """
+    from streamlit.runtime.scriptrunner import ScriptRunnerEvent
+    from streamlit.testing.v1 import local_script_runner
+
+    runner_cls = local_script_runner.LocalScriptRunner
+    original_init = runner_cls.__init__
+    original_request_rerun = runner_cls.request_rerun
+
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+
+        def on_event(sender, event, **data):
+            if event == ScriptRunnerEvent.ENQUEUE_FORWARD_MSG:
+                msg = data["forward_msg"]
+                meter["messages"] += 1
+                meter["bytes"] += msg.ByteSize()
+                if msg.HasField("delta") and msg.delta.fragment_id and msg.delta.HasField("new_element"):
+                    element = msg.delta.new_element
+                    widget_id = getattr(getattr(element, element.WhichOneof("type")), "id", None)
+                    if widget_id:
+                        meter["fragments"][widget_id] = msg.delta.fragment_id
+            elif event == ScriptRunnerEvent.SCRIPT_STARTED:
+                meter["script_runs"] += 1
+
+        self.on_event.connect(on_event, weak=False)
+
+    def request_rerun(self, rerun_data):
+        fragment_id = meter.pop("fragment_id", None)
+        accepted = original_request_rerun(self, rerun_data)
+        if fragment_id:
+            # Each AppTest run starts a fresh runner whose initial full-script request
+            # would absorb a fragment request, so scope the pending request directly.
+            requests = self._requests
+            with requests._lock:
+                requests._rerun_data = dataclasses.replace(
+                    requests._rerun_data, fragment_id_queue=[fragment_id]
+                )
+        return accepted
+
+    runner_cls.__init__ = __init__
+    runner_cls.request_rerun = request_rerun
+
+
+def profile_interactions(base_url, text, timeout=120):
+    """Server CPU time and websocket payload of each interaction in one AppTest session.
+
+    CPU is process time, so it includes any background threads the interaction started.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    meter = {"messages": 0, "bytes": 0, "script_runs": 0, "fragments": {}}
+    _instrument_runner(meter)
+    at = AppTest.from_file(os.path.join(ROOT, "App.py"), default_timeout=timeout)
+    at.session_state["page"] = "tools"
+    at.session_state["client"] = utils.get_openai_client("benchmark", base_url=base_url)
+    at.session_state["document"] = utils.open_document([text])
+    at.session_state["document_name"] = "benchmark.pdf"
+
+    results = []
+    for name, get_widget, value in INTERACTIONS:
+        scoped = False
+        if get_widget is not None:
+            widget = get_widget(at)
+            widget.click() if value is None else widget.set_value(value)
+            fragment_id = meter["fragments"].get(widget.id)
+            if fragment_id:
+                meter["fragment_id"] = fragment_id
+                scoped = True
+
+        meter.update(messages=0, bytes=0, script_runs=0)
+        started = time.process_time()
+        at.run()
+        cpu = time.process_time() - started
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        results.append({
+            "name": f"interaction_{name}",
+            "params": {},
+            "cpu_s": cpu,
+            "payload_bytes": meter["bytes"],
+            "messages": meter["messages"],
+            "script_runs": meter["script_runs"],
+            "fragment_scoped": scoped,
+        })
+        if scoped:
+            # AppTest only keeps the elements of the last run; rebuild the full tree
+            # (unmeasured) so the next interaction can find its widget.
+            at.run()
+        # Quiz and audio finish in the background; collect them (unmeasured) before moving on
+        wait_for_jobs(at)
+    return results
+
+
+def bench_interactions(base_url, text):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        results = pool.submit(profile_interactions, base_url, text).result()
+    for r in results:
+        print(
+            f"{r['name']:<30} cpu={r['cpu_s'] * 1000:.1f}ms payload={r['payload_bytes'] / 1024:.1f}KB "
+            f"messages={r['messages']} runs={r['script_runs']}{' (fragment)' if r['fragment_scoped'] else ''}"
+        )
+    return results
+
+
+def compare(previous_path, current):
+    """Prints p95 and throughput deltas against an earlier results file."""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    key = lambda r: (r["name"], json.dumps(r["params"], sort_keys=True))
+    before = {key(r): r for r in previous["results"]}
+    print("\nChange vs", previous_path)
+    for result in current["results"]:
+        old = before.get(key(result))
+        if old and "cpu_s" in old and "cpu_s" in result:
+            cpu = (result["cpu_s"] - old["cpu_s"]) / old["cpu_s"] * 100 if old["cpu_s"] else 0.0
+            size = result["payload_bytes"] - old["payload_bytes"]
+            size = size / old["payload_bytes"] * 100 if old["payload_bytes"] else 0.0
+            print(f"{result['name']:<30} {'':<56} cpu {cpu:+6.1f}%  payload {size:+6.1f}%")
+            continue
+        if not old or "p95_s" not in old or "p95_s" not in result:
+            continue
+        p95 = (result["p95_s"] - old["p95_s"]) / old["p95_s"] * 100 if old["p95_s"] else 0.0
+        old_thr = old["throughput_per_s"]
+        thr = (result["throughput_per_s"] - old_thr) / old_thr * 100 if old_thr else 0.0
+        print(
+            f"{result['name']:<30} {json.dumps(result['params'], sort_keys=True):<56} "
+            f"p95 {p95:+6.1f}%  throughput {thr:+6.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline CogniFast Study benchmarks.")
+    parser.add_argument("--pages", default="10,50,200", help="Comma-separated corpus sizes.")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub time to first token (s).")
+    parser.add_argument("--token-rate", type=float, default=500.0, help="Stub tokens per second.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail.")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of stub requests that stall.")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="Extra seconds a stalled request takes.")
+    parser.add_argument("--skip-apptest", action="store_true")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    sizes = [int(p) for p in args.pages.split(",")]
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+    audio.default_backend = audio.SilentBackend()
+
+    corpus = build_corpus(os.path.join(os.environ["COGNIFAST_CACHE_DIR"], "corpus"), sizes)
+    text = utils.extract_text_from_pdf(corpus[max(sizes)], cache=None)
+    config = StubConfig(
+        args.latency, args.token_rate, args.error_rate, tail_rate=args.tail_rate, tail_latency=args.tail_latency
+    )
+
+    results = bench_extraction(corpus, args.iterations, args.workers)
+    with StubServer(config) as server:
+        client = utils.get_openai_client("benchmark", base_url=server.base_url)
+        results += bench_generators(client, text, args.iterations, concurrency_levels)
+        if not args.skip_apptest:
+            results += bench_sessions(server.base_url, text, concurrency_levels)
+            results += bench_interactions(server.base_url, text)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stub": {
+                "latency": args.latency,
+                "token_rate": args.token_rate,
+                "error_rate": args.error_rate,
+                "requests": config.requests,
+                "injected_errors": config.errors,
+                "tail_rate": args.tail_rate,
+                "tail_latency": args.tail_latency,
+                "aborted_streams": config.aborted,
+            },
+            "hedging": utils.routing.hedger.stats(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(args.compare, report)
+
@@ -0,0 +1,229 @@
+"""Local stand-in for an OpenAI-compatible chat-completions endpoint.
+
+Latency, token rate and error injection are configurable so benchmarks can run
+offline and without spending API quota.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+QUIZ_REPLY = json.dumps({"quiz": [
+    {
+        "question": f"Which statement about topic {i} is correct?",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+        "answer": "Option B",
+    }
+    for i in range(10)
+]})
+FLASHCARDS_REPLY = json.dumps({"flashcards": [
+    {"concept": f"Concept {i}", "definition": f"Definition of concept {i}."} for i in range(6)
+]})
+DIAGRAM_REPLY = "digraph G {\n  Topic -> Subtopic1;\n  Topic -> Subtopic2;\n  Subtopic1 -> Detail;\n}"
+PROSE_REPLY = " ".join(
+    f"Sentence {i} explains one of the key ideas from the document in plain language." for i in range(40)
+)
+
+
+def reply_for(prompt):
+    """Picks a canned reply shaped like what the app expects for this prompt."""
+    if "multiple choice quiz" in prompt:
+        return QUIZ_REPLY
+    if "concepts and definitions" in prompt:
+        return FLASHCARDS_REPLY
+    if "Graphviz" in prompt:
+        return DIAGRAM_REPLY
+    return PROSE_REPLY
+
+
+def _split_tokens(text):
+    # Roughly four characters per token, like the app's own estimate.
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class StubConfig:
+    def __init__(self, latency=0.2, token_rate=500.0, error_rate=0.0, error_status=429, retry_after=0.5,
+                 tail_rate=0.0, tail_latency=2.0):
+        self.latency = latency          # Seconds before the first token
+        self.token_rate = token_rate    # Completion tokens per second after that
+        self.error_rate = error_rate    # Fraction of requests that fail
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.tail_rate = tail_rate      # Fraction of requests that stall before the first token
+        self.tail_latency = tail_latency
+        self.requests = 0
+        self.errors = 0
+        self.aborted = 0                # Streams the client closed before the end
+        self.lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            fail = random.random() < config.error_rate
+            if fail:
+                config.errors += 1
+            stall = random.random() < config.tail_rate
+        if fail:
+            self._send_json(
+                config.error_status,
+                {"error": {"message": "injected error", "type": "stub_error"}},
+                {"Retry-After": str(config.retry_after)},
+            )
+            return
+
+        prompt = " ".join(str(m.get("content", "")) for m in request.get("messages", []))
+        tokens = _split_tokens(reply_for(prompt))
+        prompt_tokens = len(prompt) // 4 + 1
+        time.sleep(config.latency + (config.tail_latency if stall else 0.0))
+
+        if request.get("stream"):
+            try:
+                self._stream(request, tokens, prompt_tokens)
+            except (BrokenPipeError, ConnectionResetError):
+                with config.lock:
+                    config.aborted += 1
+                self.close_connection = True
+            return
+
+        time.sleep(len(tokens) / config.token_rate)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        })
+
+    def _stream(self, request, tokens, prompt_tokens):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        for i, token in enumerate(tokens):
+            send(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token} if i == 0 else {"content": token},
+                    "finish_reason": None,
+                }],
+            }))
+            time.sleep(1.0 / self.config.token_rate)
+        send(json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        }))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubServer:
+    """Runs the stub on a background thread; use as a context manager."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        handler = type("Handler", (_Handler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local OpenAI-compatible stub.")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=500.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        args.latency, args.token_rate, args.error_rate, tail_rate=args.tail_rate, tail_latency=args.tail_latency
+    )
+    server = StubServer(config, port=args.port)
+    print(f"Stub listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import threading
+import time
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+MAX_CONNECTIONS = int(os.environ.get("COGNIFAST_HTTP_MAX_CONNECTIONS", 200))
+MAX_KEEPALIVE = int(os.environ.get("COGNIFAST_HTTP_MAX_KEEPALIVE", 50))
+KEEPALIVE_EXPIRY = float(os.environ.get("COGNIFAST_HTTP_KEEPALIVE_EXPIRY", 60))
+REQUEST_TIMEOUT = float(os.environ.get("COGNIFAST_HTTP_TIMEOUT", 60))
+CONNECT_TIMEOUT = float(os.environ.get("COGNIFAST_HTTP_CONNECT_TIMEOUT", 5))
+CLIENT_IDLE_TTL = float(os.environ.get("COGNIFAST_CLIENT_IDLE_TTL", 30 * 60))
+
+
+def key_id(api_key):
+    """Hash identifying an API key in process-wide state, so the key itself is never used as one."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ClientRegistry:
+    """Process-wide OpenAI clients keyed by API key and base URL.
+
+    Every client shares one keep-alive HTTP connection pool, so sessions reuse warm
+    TLS connections to the API instead of each paying for their own handshakes.
+    """
+
+    def __init__(
+        self,
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+        timeout=REQUEST_TIMEOUT,
+        connect_timeout=CONNECT_TIMEOUT,
+        idle_ttl=CLIENT_IDLE_TTL,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.idle_ttl = idle_ttl
+        self._http_client = None
+        self._clients = {}  # (key hash, base_url) -> [client, last_used]
+        self._lock = threading.Lock()
+
+    def _shared_http_client(self):
+        if self._http_client is None:
+            self._http_client = DefaultHttpxClient(limits=self.limits, timeout=self.timeout)
+        return self._http_client
+
+    def get(self, api_key, base_url=GROQ_BASE_URL):
+        """Returns the shared client for this API key and endpoint, creating it if needed."""
+        key = (key_id(api_key), base_url)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=self._shared_http_client(),
+                    max_retries=0,  # Retries are owned by the key's scheduler
+                )
+                entry = self._clients[key] = [client, now]
+            entry[1] = now
+            return entry[0]
+
+    def _evict_idle(self, now):
+        # Evicted clients are only dropped, never closed: the pool they use is shared.
+        for key in [k for k, (_, last_used) in self._clients.items() if now - last_used > self.idle_ttl]:
+            del self._clients[key]
+
+    def close(self):
+        """Drops every client and closes the shared connection pool."""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._clients)}
+
+
+registry = ClientRegistry()
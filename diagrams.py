@@ -0,0 +1,465 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+import metrics
+from pdf_cache import CACHE_DIR
+
+
+MAX_NODES = int(os.environ.get("COGNIFAST_DIAGRAM_MAX_NODES", 40))
+MAX_EDGES = int(os.environ.get("COGNIFAST_DIAGRAM_MAX_EDGES", 80))
+LAYOUT_TIMEOUT = float(os.environ.get("COGNIFAST_DIAGRAM_LAYOUT_TIMEOUT", 10))
+SVG_LIMIT_BYTES = int(os.environ.get("COGNIFAST_DIAGRAM_CACHE_BYTES", 64 * 1024 * 1024))
+HOT_LIMIT_ITEMS = 64
+
+_TOKEN_RE = re.compile(
+    r'\s*(?:'
+    r'(?P<comment>//[^\n]*|#[^\n]*|/\*.*?\*/)'
+    r'|(?P<string>"(?:[^"\\]|\\.)*")'
+    r'|(?P<html><(?:[^<>]|<[^<>]*>)*>)'
+    r'|(?P<edge>->|--)'
+    r'|(?P<punct>[{}\[\]=;,:])'
+    r'|(?P<id>[A-Za-z_\u0080-\uffff][\w\u0080-\uffff.]*|-?(?:\.\d+|\d+(?:\.\d*)?))'
+    r')',
+    re.DOTALL,
+)
+_KEYWORDS = {"graph", "digraph", "subgraph", "node", "edge", "strict"}
+
+
+class DotError(ValueError):
+    """Raised when DOT text cannot be parsed."""
+
+
+class Html(str):
+    """An HTML-like label, <...> included, written back without quotes."""
+
+
+class Graph:
+    """The parts of a DOT graph the mind map uses: nodes, edges, defaults and clusters."""
+
+    def __init__(self, directed=True, name="G"):
+        self.directed = directed
+        self.name = name
+        self.graph_attrs = {}
+        self.node_defaults = {}
+        self.edge_defaults = {}
+        self.nodes = OrderedDict()  # id -> attrs
+        self.edges = []  # (tail, head, attrs)
+        self.clusters = []  # (name, attrs, [node ids])
+
+    def add_node(self, node_id, attrs=None):
+        self.nodes.setdefault(node_id, {}).update(attrs or {})
+
+    def to_dot(self):
+        """Serialises the graph as canonical DOT with every identifier quoted."""
+        op = "->" if self.directed else "--"
+        lines = [f"{'digraph' if self.directed else 'graph'} {_quote(self.name)} {{"]
+        for kind, attrs in (("graph", self.graph_attrs), ("node", self.node_defaults), ("edge", self.edge_defaults)):
+            if attrs:
+                lines.append(f"  {kind} {_attrs(attrs)};")
+        clustered = set()
+        for name, attrs, members in self.clusters:
+            members = [m for m in members if m in self.nodes]
+            if not members:
+                continue
+            lines.append(f"  subgraph {_quote(name)} {{")
+            for key, value in attrs.items():
+                lines.append(f"    {_quote(key)}={_quote(value)};")
+            for node_id in members:
+                lines.append(f"    {_node_line(node_id, self.nodes[node_id])}")
+                clustered.add(node_id)
+            lines.append("  }")
+        for node_id, attrs in self.nodes.items():
+            if node_id not in clustered:
+                lines.append(f"  {_node_line(node_id, attrs)}")
+        for tail, head, attrs in self.edges:
+            suffix = f" {_attrs(attrs)}" if attrs else ""
+            lines.append(f"  {_quote(tail)} {op} {_quote(head)}{suffix};")
+        lines.append("}")
+        return "\n".join(lines)
+
+
+def _quote(value):
+    if isinstance(value, Html):
+        return value
+    # Quoted strings keep their escapes from parsing (\n, \l, \"), so they are written back as is
+    return f'"{value}"'
+
+
+def _attrs(attrs):
+    return "[" + ", ".join(f"{_quote(k)}={_quote(v)}" for k, v in attrs.items()) + "]"
+
+
+def _node_line(node_id, attrs):
+    return f"{_quote(node_id)} {_attrs(attrs)};" if attrs else f"{_quote(node_id)};"
+
+
+def _tokenize(text):
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            if text[pos:].strip() == "":
+                break
+            raise DotError(f"unexpected character {text[pos]!r} at offset {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1]
+        elif kind == "html":
+            value = Html(value)
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def symbol(self, offset=0):
+        """The token as syntax: quoted strings and HTML labels never match a keyword or brace."""
+        kind, value = self.peek(offset)
+        return "" if kind in ("string", "html") else value
+
+    def take(self, value=None):
+        token = self.peek()
+        if token[0] is None:
+            raise DotError("unexpected end of graph, is a closing brace missing?")
+        if value is not None and self.symbol() != value:
+            raise DotError(f"expected {value!r} but found {token[1]!r}")
+        self.pos += 1
+        return token[1]
+
+    def accept(self, value):
+        if self.symbol() == value:
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        self.accept("strict")
+        kind = self.symbol()
+        if kind not in ("graph", "digraph"):
+            raise DotError(f"expected 'digraph' or 'graph' but found {self.peek()[1]!r}")
+        self.take()
+        name = "G"
+        if self.symbol() != "{":
+            name = self.take()
+        graph = Graph(directed=kind == "digraph", name=name)
+        self.take("{")
+        self.statements(graph, None)
+        self.take("}")
+        if self.peek()[0] is not None:
+            raise DotError(f"unexpected {self.peek()[1]!r} after the closing brace")
+        return graph
+
+    def attr_list(self):
+        attrs = {}
+        while self.accept("["):
+            while not self.accept("]"):
+                key = self.take()
+                value = "true"
+                if self.accept("="):
+                    value = self.take()
+                attrs[key] = value
+                self.accept(",") or self.accept(";")
+        return attrs
+
+    def node_id(self):
+        kind, value = self.peek()
+        if kind not in ("id", "string", "html") or (kind == "id" and value in _KEYWORDS):
+            raise DotError(f"expected a node name but found {value!r}")
+        self.pos += 1
+        if self.accept(":"):  # Ports are dropped
+            self.take()
+            if self.accept(":"):
+                self.take()
+        return value
+
+    def statements(self, graph, cluster):
+        while self.symbol() not in ("}", None):
+            self.statement(graph, cluster)
+            self.accept(";")
+
+    def statement(self, graph, cluster):
+        kind, value = self.peek()
+        if value in ("graph", "node", "edge") and kind == "id":
+            self.pos += 1
+            attrs = self.attr_list()
+            target = {"graph": graph.graph_attrs, "node": graph.node_defaults, "edge": graph.edge_defaults}[value]
+            if value == "graph" and cluster is not None:
+                target = cluster[1]
+            target.update(attrs)
+            return
+        if self.symbol() == "subgraph" or (self.symbol() == "{" and self._group_is_subgraph()):
+            self.subgraph(graph)
+            return
+        if self.symbol(1) == "=":
+            key = self.take()
+            self.take("=")
+            (cluster[1] if cluster is not None else graph.graph_attrs)[key] = self.take()
+            return
+
+        chain = [self.endpoint()]
+        # "--" in a digraph (or "->" in a graph) is a common model slip; the graph kind wins.
+        while self.peek()[0] == "edge":
+            self.take()
+            chain.append(self.endpoint())
+        attrs = self.attr_list()
+        for group in chain:
+            for node_id in group:
+                graph.add_node(node_id, attrs if len(chain) == 1 else None)
+                if cluster is not None and node_id not in cluster[2]:
+                    cluster[2].append(node_id)
+        for tails, heads in zip(chain, chain[1:]):
+            for tail in tails:
+                for head in heads:
+                    graph.edges.append((tail, head, dict(attrs)))
+
+    def endpoint(self):
+        """A node, or an anonymous { a b c } group as in a -> {b c}."""
+        if not self.accept("{"):
+            return [self.node_id()]
+        group = []
+        while not self.accept("}"):
+            if not (self.accept(";") or self.accept(",")):
+                group.append(self.node_id())
+        return group
+
+    def _group_is_subgraph(self):
+        """Tells a braced block statement from a { a b } -> c edge group."""
+        depth, offset = 0, 0
+        while True:
+            value = self.symbol(offset)
+            if value is None:
+                return True
+            if value == "{":
+                depth += 1
+            elif value == "}":
+                depth -= 1
+                if depth == 0:
+                    return self.peek(offset + 1)[0] != "edge"
+            offset += 1
+
+    def subgraph(self, graph):
+        name = None
+        if self.accept("subgraph") and self.symbol() != "{":
+            name = self.take()
+        self.take("{")
+        if name and name.startswith("cluster"):
+            cluster = (name, {}, [])
+            graph.clusters.append(cluster)
+            self.statements(graph, cluster)
+        else:
+            # Plain subgraphs only group statements; their contents join the parent.
+            self.statements(graph, None)
+        self.take("}")
+
+
+def parse_dot(text):
+    """Parses model output into a Graph, tolerating code fences and trailing prose."""
+    text = re.sub(r"^```[a-zA-Z]*\s*|```\s*$", "", text.strip(), flags=re.MULTILINE)
+    start = re.search(r"\b(?:strict\s+)?(?:di)?graph\b", text)
+    if not start:
+        raise DotError("no 'digraph' or 'graph' header found")
+    text = text[start.start():]
+    end = text.rfind("}")
+    if end == -1:
+        raise DotError("the graph has no closing brace")
+    graph = _Parser(_tokenize(text[:end + 1])).parse()
+    if not graph.nodes:
+        raise DotError("the graph has no nodes")
+    return graph
+
+
+def prune(graph, max_nodes=MAX_NODES, max_edges=MAX_EDGES):
+    """Keeps the top levels of a large graph and folds the rest into "+N more" nodes.
+
+    Nodes are kept breadth-first from the roots (nodes nothing points to, or the
+    best-connected node when every node has a parent). Returns the number of
+    nodes removed.
+    """
+    if len(graph.nodes) <= max_nodes and len(graph.edges) <= max_edges:
+        return 0
+
+    children, indegree, degree = defaultdict(list), defaultdict(int), defaultdict(int)
+    for tail, head, _ in graph.edges:
+        children[tail].append(head)
+        if not graph.directed:
+            children[head].append(tail)
+        indegree[head] += 1
+        degree[tail] += 1
+        degree[head] += 1
+    roots = [n for n in graph.nodes if indegree[n] == 0 and degree[n] > 0] if graph.directed else []
+    if not roots:
+        roots = [max(graph.nodes, key=lambda n: degree[n])]
+
+    # Leave room for one summary node per parent that loses children.
+    budget = max(1, max_nodes * 3 // 4)
+    kept = OrderedDict((r, True) for r in roots[:budget])
+    level = list(kept)
+    while level and len(kept) < budget:
+        # Take the next level whole if it fits, else round-robin across parents
+        # so every branch keeps its first children.
+        branches = [deque(c for c in children[n] if c not in kept) for n in level]
+        level = []
+        while len(kept) < budget and any(branches):
+            for branch in branches:
+                while branch and branch[0] in kept:
+                    branch.popleft()
+                if branch and len(kept) < budget:
+                    node = branch.popleft()
+                    kept[node] = True
+                    level.append(node)
+
+    dropped_by_parent = defaultdict(set)
+    for tail, head, _ in graph.edges:
+        if tail in kept and head not in kept:
+            dropped_by_parent[tail].add(head)
+
+    removed = len(graph.nodes) - len(kept)
+    graph.nodes = OrderedDict((n, a) for n, a in graph.nodes.items() if n in kept)
+    edges = [(t, h, a) for t, h, a in graph.edges if t in kept and h in kept]
+    summaries = list(dropped_by_parent.items())[:min(max_nodes - len(graph.nodes), max_edges)]
+    # Truncate the kept edges first so the summary edges always fit
+    edges = edges[:max_edges - len(summaries)]
+    for parent, dropped in summaries:
+        summary = f"{parent} (+{len(dropped)} more)"
+        graph.add_node(summary, {"label": f"+{len(dropped)} more", "style": "dashed"})
+        edges.append((parent, summary, {"style": "dashed"}))
+    graph.edges = edges
+    return removed
+
+
+def validate_dot(text, max_nodes=MAX_NODES, max_edges=MAX_EDGES):
+    """Parses, prunes and re-serialises model DOT; raises DotError if it is unusable.
+
+    Returns (dot, info) where info has the node, edge and pruned counts.
+    """
+    graph = parse_dot(text)
+    pruned = prune(graph, max_nodes, max_edges)
+    info = {"nodes": len(graph.nodes), "edges": len(graph.edges), "pruned": pruned}
+    return graph.to_dot(), info
+
+
+def dot_key(dot):
+    """Returns the hash used to cache a layout."""
+    return hashlib.sha256(dot.encode("utf-8")).hexdigest()
+
+
+class SvgCache:
+    """Two-tier (memory, then disk) LRU cache of rendered SVG keyed by DOT hash."""
+
+    def __init__(self, directory=None, max_bytes=SVG_LIMIT_BYTES, hot_items=HOT_LIMIT_ITEMS):
+        self.directory = os.path.join(directory or CACHE_DIR, "diagrams")
+        self.max_bytes = max_bytes
+        self.hot_items = hot_items
+        self._hot = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.svg")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return self._hot[key]
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                svg = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._remember(key, svg)
+        return svg
+
+    def put(self, key, svg):
+        with self._lock:
+            self._remember(key, svg)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(svg)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict_disk()
+
+    def _remember(self, key, svg):
+        self._hot[key] = svg
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_items:
+            self._hot.popitem(last=False)
+
+    def _evict_disk(self):
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith(".svg")]
+        except OSError:
+            return
+        entries = sorted(((e.stat(), e.path) for e in entries), key=lambda x: x[0].st_mtime)
+        total = sum(st.st_size for st, _ in entries)
+        for st, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= st.st_size
+            except OSError:
+                pass
+
+
+def _layout(dot):
+    """Runs Graphviz dot; returns SVG text, or None when Graphviz is not installed."""
+    binary = shutil.which("dot")
+    if binary is None:
+        return None
+    result = subprocess.run(
+        [binary, "-Tsvg"], input=dot.encode("utf-8"), capture_output=True, timeout=LAYOUT_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise DotError(result.stderr.decode("utf-8", "replace").strip() or "Graphviz failed")
+    svg = result.stdout.decode("utf-8")
+    # Drop the XML prologue so the SVG can be embedded directly.
+    return svg[svg.find("<svg"):]
+
+
+def render_svg(dot, cache=None):
+    """Lays out validated DOT as SVG, reusing the cached layout for identical DOT.
+
+    Returns None when Graphviz is not available, so callers can fall back to
+    client-side rendering.
+    """
+    cache = cache or default_cache
+    key = dot_key(dot)
+    with metrics.track("diagram", "layout", dot_chars=len(dot)) as event:
+        svg = cache.get(key)
+        event["cache_hit"] = svg is not None
+        if svg is None:
+            svg = _layout(dot)
+            if svg is not None:
+                cache.put(key, svg)
+        event["svg_bytes"] = len(svg) if svg is not None else 0
+    return svg
+
+
+default_cache = SvgCache()
@@ -0,0 +1,121 @@
+import hashlib
+import sys
+import threading
+import weakref
+
+from retrieval import build_index
+from text_prep import pin, prepare, unpin
+
+
+class DocumentHandle:
+    """What a session keeps instead of the document itself.
+
+    Releasing the handle, or the session state that holds it being collected,
+    drops the session's reference in the store.
+    """
+
+    def __init__(self, store, key):
+        self.key = key
+        self._store = store
+        self._finalizer = weakref.finalize(self, store._release, key)
+
+    @property
+    def text(self):
+        return self._store._entry(self.key)["text"]
+
+    @property
+    def pages(self):
+        """Per-page text, sliced out of the shared text on demand."""
+        entry = self._store._entry(self.key)
+        text, offsets = entry["text"], entry["offsets"]
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    @property
+    def index(self):
+        """The shared retrieval index for this document, built on first use."""
+        return self._store._index(self.key)
+
+    def release(self):
+        self._finalizer()
+
+
+class DocumentStore:
+    """Process-wide, content-addressed, reference-counted store of extracted documents."""
+
+    def __init__(self):
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def add(self, pages):
+        """Stores pages (deduplicated by content) and returns a new handle to them."""
+        text = "".join(pages)
+        offsets = [0]
+        for page in pages:
+            offsets.append(offsets[-1] + len(page))
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._docs.get(key)
+            if entry is None:
+                entry = self._docs[key] = {
+                    "offsets": offsets,  # Page boundaries, so pages are not held twice
+                    "text": text,
+                    "index": None,
+                    "refs": 0,
+                    "lock": threading.Lock(),
+                }
+                # Held while the document is open, so every generator prompts from the
+                # same page-aware compaction whichever one asks first
+                pin(text, pages)
+            entry["refs"] += 1
+        return DocumentHandle(self, key)
+
+    def _entry(self, key):
+        with self._lock:
+            return self._docs[key]
+
+    def _index(self, key):
+        entry = self._entry(key)
+        with entry["lock"]:
+            if entry["index"] is None:
+                text, offsets = entry["text"], entry["offsets"]
+                pages = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+                entry["index"] = build_index(prepare(text, pages))
+            return entry["index"]
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._docs.get(key)
+            if entry is None:
+                return
+            entry["refs"] -= 1
+            if entry["refs"] <= 0:
+                del self._docs[key]
+                unpin(entry["text"])
+
+    @staticmethod
+    def _resident_bytes(entry):
+        size = sys.getsizeof(entry["text"]) + sys.getsizeof(entry["offsets"])
+        index = entry["index"]
+        if index is not None:
+            size += sum(sys.getsizeof(c) for c in index.chunks)
+            size += sum(getattr(index, name).nbytes for name in ("_terms", "_docs", "_tfs", "_idf", "_norm"))
+            size += sys.getsizeof(index.vocab)
+        return size
+
+    def stats(self):
+        """Returns per-document reference counts and approximate resident bytes."""
+        with self._lock:
+            entries = list(self._docs.items())
+        docs = [
+            {
+                "key": key,
+                "refs": entry["refs"],
+                "pages": len(entry["offsets"]) - 1,
+                "bytes": self._resident_bytes(entry),
+            }
+            for key, entry in entries
+        ]
+        return {"documents": len(docs), "bytes": sum(d["bytes"] for d in docs), "per_document": docs}
+
+
+default_store = DocumentStore()
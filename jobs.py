@@ -0,0 +1,299 @@
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_cache import CACHE_DIR
+
+
+WORKERS = int(os.environ.get("COGNIFAST_JOB_WORKERS", 8))
+# Jobs one user may have running at once; further jobs wait in that user's queue.
+PER_USER = int(os.environ.get("COGNIFAST_JOBS_PER_USER", 2))
+# Finished jobs are kept this long so a session can still collect the result.
+RETENTION_SECONDS = float(os.environ.get("COGNIFAST_JOB_RETENTION", 24 * 60 * 60))
+MEMORY_ITEMS = 256
+# Active jobs are re-saved this often, so other processes sharing the directory can tell they are alive.
+HEARTBEAT_SECONDS = 10
+# An active job without a heartbeat for this long was left behind by a process that is gone.
+ORPHAN_SECONDS = 6 * HEARTBEAT_SECONDS
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+logger = logging.getLogger("cognifast.jobs")
+
+
+class Cancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+class Job:
+    """One unit of background work and its observable state.
+
+    The work function receives the job and reports through progress(), append()
+    and publish(); it should call check() between steps so cancellation takes effect.
+    """
+
+    def __init__(self, user, kind, key, fn=None, id=None):
+        self.id = id or uuid.uuid4().hex
+        self.user = user
+        self.kind = kind
+        self.key = key
+        self.state = QUEUED
+        self.progress_value = 0.0
+        self.message = ""
+        self.partial = ""  # Text produced so far, e.g. a script being streamed
+        self.outputs = {}  # Intermediate results shown while the job runs, e.g. a first audio segment
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+        self.owner = OWNER  # The process running the job
+        self.heartbeat = self.created
+        self._fn = fn
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state not in ACTIVE
+
+    @property
+    def orphaned(self):
+        """True for an active job whose process stopped updating it."""
+        return not self.finished and time.time() - self.heartbeat > ORPHAN_SECONDS
+
+    def progress(self, fraction, message=None):
+        self.check()
+        self.progress_value = max(0.0, min(1.0, fraction))
+        if message is not None:
+            self.message = message
+
+    def append(self, text):
+        self.check()
+        self.partial += text
+
+    def publish(self, name, value):
+        """Makes an intermediate result available before the job finishes; value must be JSON-serialisable."""
+        self.check()
+        self.outputs[name] = value
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled(self.id)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "user": self.user, "kind": self.kind, "key": self.key,
+            "state": self.state, "progress": self.progress_value, "message": self.message,
+            "outputs": self.outputs, "result": self.result, "error": self.error,
+            "created": self.created, "finished_at": self.finished_at,
+            "owner": self.owner, "heartbeat": self.heartbeat,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["user"], data["kind"], data["key"], id=data["id"])
+        job.state = data["state"]
+        job.progress_value = data.get("progress", 0.0)
+        job.message = data.get("message", "")
+        job.outputs = data.get("outputs", {})
+        job.result = data.get("result")
+        job.error = data.get("error")
+        job.created = data.get("created", job.created)
+        job.finished_at = data.get("finished_at")
+        job.owner = data.get("owner")
+        job.heartbeat = data.get("heartbeat", job.created)
+        return job
+
+
+class JobRunner:
+    """Runs jobs on a shared worker pool with a per-user concurrency limit.
+
+    A job's state is written to disk whenever it changes, and active jobs are
+    re-saved on a heartbeat, so results outlive the session's reruns and a job
+    whose process died is reported as interrupted instead of lost. Processes may
+    share the directory: only jobs whose heartbeat stopped are recovered.
+    Submitting a job identical to one that is still active returns that job.
+    """
+
+    def __init__(self, workers=WORKERS, per_user=PER_USER, directory=None, retention=RETENTION_SECONDS):
+        self.per_user = per_user
+        self.retention = retention
+        self.directory = os.path.join(directory or CACHE_DIR, "jobs")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._active = {}  # (user, kind, key) -> job
+        self._running = {}  # user -> running job count
+        self._waiting = {}  # user -> deque of queued jobs
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._recover()
+        threading.Thread(target=self._beat, name="job-heartbeat", daemon=True).start()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job):
+        os.makedirs(self.directory, exist_ok=True)
+        # Serialised, so a heartbeat cannot overwrite a newer final state
+        with self._save_lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(job.to_dict(), f)
+                os.replace(tmp_path, self._path(job.id))
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning("could not persist job %s: %s", job.id, e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self._lock:
+                active = [job for job in self._jobs.values() if not job.finished]
+            for job in active:
+                job.heartbeat = time.time()
+                self._save(job)
+
+    def _fail_orphan(self, job):
+        job.state, job.error, job.finished_at = FAILED, "Interrupted by a server restart.", time.time()
+        self._save(job)
+
+    def _recover(self):
+        """Marks jobs whose process is gone as failed and drops expired ones."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        cutoff = time.time() - self.retention
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.created < cutoff:
+                os.remove(path)
+            elif job.orphaned:
+                self._fail_orphan(job)
+
+    def submit(self, user, kind, key, fn):
+        """Queues fn(job) for user, or returns the active job with the same kind and key."""
+        identity = (user, kind, key)
+        with self._lock:
+            existing = self._active.get(identity)
+            if existing is not None:
+                return existing
+            job = Job(user, kind, key, fn)
+            self._jobs[job.id] = job
+            self._active[identity] = job
+            self._trim()
+            if self._running.get(user, 0) < self.per_user:
+                self._start(job)
+            else:
+                job.message = "Waiting for your other jobs to finish..."
+                self._waiting.setdefault(user, deque()).append(job)
+        self._save(job)
+        return job
+
+    def _start(self, job):
+        # Called with the lock held
+        self._running[job.user] = self._running.get(job.user, 0) + 1
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.check()
+            job.state, job.message = RUNNING, ""
+            self._save(job)
+            result = job._fn(job)
+            job.check()
+        except Cancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            logger.info("%s job %s failed: %s", job.kind, job.id, e)
+            job.state, job.error = FAILED, str(e)
+        else:
+            job.result, job.progress_value, job.state = result, 1.0, DONE
+        job.finished_at = time.time()
+        job._fn = None  # Drops the references the work held, e.g. to the document
+        self._save(job)
+        self._release(job)
+
+    def _release(self, job):
+        with self._lock:
+            if self._active.get((job.user, job.kind, job.key)) is job:
+                del self._active[(job.user, job.kind, job.key)]
+            self._running[job.user] -= 1
+            waiting = self._waiting.get(job.user)
+            while waiting and self._running[job.user] < self.per_user:
+                self._start(waiting.popleft())
+            if not self._running[job.user]:
+                del self._running[job.user]
+            if not waiting:
+                self._waiting.pop(job.user, None)
+
+    def _trim(self):
+        # Called with the lock held; finished jobs stay readable from disk
+        while len(self._jobs) > MEMORY_ITEMS:
+            oldest = next((i for i, j in self._jobs.items() if j.finished), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
+
+    def get(self, job_id):
+        """Returns a job by id, reading it back from disk if it is no longer in memory."""
+        if job_id is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                job = Job.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        if job.orphaned:
+            self._fail_orphan(job)
+        return job
+
+    def cancel(self, job_id):
+        """Cancels a queued job outright, and asks a running one to stop at its next check."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job._cancel.set()
+            waiting = self._waiting.get(job.user)
+            if waiting and job in waiting:
+                waiting.remove(job)
+                if self._active.get((job.user, job.kind, job.key)) is job:
+                    del self._active[(job.user, job.kind, job.key)]
+                job.state, job.finished_at = CANCELLED, time.time()
+            else:
+                job.message = "Cancelling..."
+        self._save(job)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": sum(self._running.values()),
+                "queued": sum(len(q) for q in self._waiting.values()),
+                "users": len(self._running),
+            }
+
+
+runner = JobRunner()
@@ -0,0 +1,225 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+WALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_COUNTERS = (
+    ("calls", "Calls made"),
+    ("errors", "Calls that raised"),
+    ("cache_hits", "Calls served from a cache"),
+    ("prompt_tokens", "Prompt tokens reported by the API"),
+    ("completion_tokens", "Completion tokens reported by the API"),
+    ("prompt_chars", "Characters sent in prompts"),
+)
+
+logger = logging.getLogger("cognifast.metrics")
+
+
+class _Series:
+    __slots__ = ("counters", "buckets", "wall_sum", "ttft_sum", "ttft_count")
+
+    def __init__(self):
+        self.counters = dict.fromkeys((name for name, _ in _COUNTERS), 0)
+        self.buckets = [0] * len(WALL_BUCKETS)
+        self.wall_sum = 0.0
+        self.ttft_sum = 0.0
+        self.ttft_count = 0
+
+
+class Recorder:
+    """Aggregates per-call events by (feature, kind) and fans them out to hooks.
+
+    Recording is a dict update under one lock, cheap enough to leave on in production.
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._gauges = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """Registers hook(event), called with every recorded event."""
+        self._hooks.append(hook)
+
+    def gauge(self, name, help_text, fn):
+        """Registers a gauge whose value is read from fn() at exposition time."""
+        self._gauges[name] = (help_text, fn, "gauge")
+
+    def counter(self, name, help_text, fn):
+        """Like gauge(), for a value that only ever increases; exported as name_total."""
+        self._gauges[f"{name}_total"] = (help_text, fn, "counter")
+
+    @contextmanager
+    def track(self, feature, kind, **fields):
+        """Times the enclosed block; the yielded event dict can be filled with extra fields."""
+        event = {"feature": feature, "kind": kind}
+        event.update(fields)
+        started = time.perf_counter()
+        try:
+            yield event
+        except Exception as e:
+            event["error"] = type(e).__name__
+            raise
+        finally:
+            event["wall"] = time.perf_counter() - started
+            self.record(event)
+
+    def record(self, event):
+        key = (event["feature"], event["kind"])
+        wall = event.get("wall", 0.0)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            counters = series.counters
+            counters["calls"] += 1
+            counters["errors"] += 1 if event.get("error") else 0
+            counters["cache_hits"] += 1 if event.get("cache_hit") else 0
+            for name in ("prompt_tokens", "completion_tokens", "prompt_chars"):
+                counters[name] += event.get(name) or 0
+            series.wall_sum += wall
+            for i, bound in enumerate(WALL_BUCKETS):
+                if wall <= bound:
+                    series.buckets[i] += 1
+                    break
+            if event.get("ttft") is not None:
+                series.ttft_sum += event["ttft"]
+                series.ttft_count += 1
+        for hook in self._hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception("metrics hook failed")
+
+    def snapshot(self):
+        """Returns the aggregates as plain dicts keyed by 'feature/kind'."""
+        with self._lock:
+            return {
+                f"{feature}/{kind}": dict(
+                    s.counters,
+                    wall_sum=s.wall_sum,
+                    ttft_avg=s.ttft_sum / s.ttft_count if s.ttft_count else None,
+                )
+                for (feature, kind), s in self._series.items()
+            }
+
+    def prometheus_text(self):
+        """Renders every series and gauge in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            for name, help_text in _COUNTERS:
+                lines.append(f"# HELP cognifast_{name}_total {help_text}.")
+                lines.append(f"# TYPE cognifast_{name}_total counter")
+                for (feature, kind), s in items:
+                    lines.append(f'cognifast_{name}_total{{feature="{feature}",kind="{kind}"}} {s.counters[name]}')
+
+            lines.append("# HELP cognifast_wall_seconds Wall time per call.")
+            lines.append("# TYPE cognifast_wall_seconds histogram")
+            for (feature, kind), s in items:
+                labels = f'feature="{feature}",kind="{kind}"'
+                cumulative = 0
+                for bound, count in zip(WALL_BUCKETS, s.buckets):
+                    cumulative += count
+                    lines.append(f'cognifast_wall_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'cognifast_wall_seconds_bucket{{{labels},le="+Inf"}} {s.counters["calls"]}')
+                lines.append(f"cognifast_wall_seconds_sum{{{labels}}} {s.wall_sum}")
+                lines.append(f"cognifast_wall_seconds_count{{{labels}}} {s.counters['calls']}")
+
+            lines.append("# HELP cognifast_ttft_seconds Time to first streamed token.")
+            lines.append("# TYPE cognifast_ttft_seconds summary")
+            for (feature, kind), s in items:
+                if s.ttft_count:
+                    labels = f'feature="{feature}",kind="{kind}"'
+                    lines.append(f"cognifast_ttft_seconds_sum{{{labels}}} {s.ttft_sum}")
+                    lines.append(f"cognifast_ttft_seconds_count{{{labels}}} {s.ttft_count}")
+
+        for name, (help_text, fn, metric_type) in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP cognifast_{name} {help_text}.")
+            lines.append(f"# TYPE cognifast_{name} {metric_type}")
+            lines.append(f"cognifast_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesHook:
+    """Appends every event as one JSON object per line to path.
+
+    Events are handed to a writer thread that keeps the file open, so recording
+    never waits on disk; the file is flushed whenever the queue runs empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="metrics-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, event):
+        self._queue.put(dict(event, ts=time.time()))
+
+    def _write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                event = self._queue.get()
+                if event is None:
+                    break
+                f.write(json.dumps(event, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self):
+        """Writes the queued events and stops the writer."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def start_http_server(port, host="0.0.0.0", recorder=None):
+    """Serves /metrics for Prometheus scraping on a daemon thread."""
+    recorder = recorder or default_recorder
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+default_recorder = Recorder()
+track = default_recorder.track
+
+if os.environ.get("COGNIFAST_METRICS_LOG"):
+    default_recorder.add_hook(JsonLinesHook(os.environ["COGNIFAST_METRICS_LOG"]))
+if os.environ.get("COGNIFAST_METRICS_PORT"):
+    try:
+        start_http_server(int(os.environ["COGNIFAST_METRICS_PORT"]))
+    except OSError:
+        # Another Streamlit worker on this host already serves the endpoint.
+        logger.warning("metrics port %s is in use", os.environ["COGNIFAST_METRICS_PORT"])
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from pdf_cache import CACHE_DIR
+from retrieval import tokenize
+from text_prep import compact_each
+
+
+DB_PATH = os.environ.get("COGNIFAST_NEAR_DUP_DB", os.path.join(CACHE_DIR, "near_dup.sqlite3"))
+# Estimated Jaccard similarity of word shingles above which two documents count as versions of each other.
+THRESHOLD = float(os.environ.get("COGNIFAST_NEAR_DUP_THRESHOLD", 0.8))
+# Chunk summaries kept for reuse, least recently used dropped first.
+SUMMARY_ITEMS = int(os.environ.get("COGNIFAST_SUMMARY_ITEMS", 20000))
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# 32 bands of 4 rows make documents above ~0.5 similarity likely candidates; THRESHOLD then decides.
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+_BLOCK = 4096
+
+_rng = np.random.RandomState(0x5EED)
+# Multiply-shift hashing: with odd a, the top 32 bits of a * x + b (mod 2**64) form a universal family.
+_A = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shingles(text):
+    """Returns the distinct 64-bit hashes of the text's overlapping word n-grams."""
+    words = tokenize(text)
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    vocab = {w: zlib.crc32(w.encode("utf-8")) for w in set(words)}
+    hashed = np.fromiter(map(vocab.__getitem__, words), dtype=np.uint64, count=len(words))
+    n = max(1, len(words) - SHINGLE_WORDS + 1)
+    grams = np.zeros(n, dtype=np.uint64)
+    for offset in range(min(SHINGLE_WORDS, len(words))):
+        # Wrapping uint64 arithmetic: a polynomial hash of the n-gram's word hashes
+        grams = grams * _MIX + hashed[offset:offset + n]
+    return np.unique(grams)
+
+
+def minhash(hashes):
+    """Returns the MinHash signature of a set of shingle hashes."""
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK):
+        values = (hashes[start:start + _BLOCK, None] * _A + _B) >> np.uint64(32)
+        np.minimum(signature, values.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the documents behind two signatures."""
+    return float(np.mean(a == b))
+
+
+def page_hash(page):
+    """Hash of a compacted page's words, insensitive to layout and punctuation."""
+    return hashlib.sha1(" ".join(tokenize(page)).encode("utf-8")).hexdigest()[:16]
+
+
+class Fingerprint:
+    """A document's MinHash signature plus one hash per page."""
+
+    def __init__(self, signature, page_hashes, shingles):
+        self.signature = signature
+        self.page_hashes = page_hashes
+        self.shingles = shingles  # Number of distinct shingles; 0 for a document without text
+
+
+def fingerprint(pages):
+    compacted = compact_each(pages)
+    hashes = shingles("\n".join(compacted))
+    return Fingerprint(minhash(hashes), [page_hash(p) for p in compacted], len(hashes))
+
+
+class Match:
+    """A stored document that the new one is a version of, and how their pages line up."""
+
+    def __init__(self, key, similarity, page_map, changed_pages):
+        self.key = key
+        self.similarity = similarity
+        self.page_map = page_map  # New page number -> the identical page in the match
+        self.changed_pages = changed_pages
+
+
+def _bands(signature):
+    rows = signature.reshape(BANDS, ROWS)
+    return [(band, hashlib.sha1(rows[band].tobytes()).hexdigest()[:16]) for band in range(BANDS)]
+
+
+class NearDupIndex:
+    """Locality-sensitive hash index of document fingerprints, persisted in SQLite.
+
+    Also keeps chunk summaries by content hash without expiry, so a revised
+    document reuses the summaries of every chunk that did not change.
+    """
+
+    def __init__(self, path=DB_PATH, threshold=THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "exact": 0, "near": 0, "summary_hits": 0, "summary_misses": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " key TEXT PRIMARY KEY, signature BLOB NOT NULL, pages TEXT NOT NULL, added REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS bands ("
+                " band INTEGER NOT NULL, bucket TEXT NOT NULL, key TEXT NOT NULL,"
+                " PRIMARY KEY (band, bucket, key)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " chunk TEXT PRIMARY KEY, summary TEXT NOT NULL, used REAL NOT NULL) WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS summaries_used ON summaries(used);"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def lookup(self, key, fp):
+        """Indexes a document and returns its closest earlier version, if one is similar enough.
+
+        Returns None for a document that is new, or that is already indexed under
+        the same key (everything keyed by it is then reused as is).
+        """
+        if not fp.shingles:
+            return None  # Scans without a text layer would all look identical
+        self._count("lookups")
+        bands = _bands(fp.signature)
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM documents WHERE key = ?", (key,)).fetchone() is not None:
+                self._count("exact")
+                return None
+            candidates = set()
+            for band, bucket in bands:
+                candidates.update(k for (k,) in conn.execute(
+                    "SELECT key FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+                ))
+            best = None
+            for candidate in candidates:
+                signature, pages = conn.execute(
+                    "SELECT signature, pages FROM documents WHERE key = ?", (candidate,)
+                ).fetchone()
+                score = similarity(fp.signature, np.frombuffer(signature, dtype=np.uint32))
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (candidate, score, json.loads(pages))
+
+            conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (key, fp.signature.tobytes(), json.dumps(fp.page_hashes), time.time()),
+            )
+            conn.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?, ?)", ((b, h, key) for b, h in bands))
+
+        if best is None:
+            return None
+        self._count("near")
+        candidate, score, old_hashes = best
+        old_pages = {}
+        for number, h in enumerate(old_hashes, 1):
+            old_pages.setdefault(h, number)
+        page_map = {n: old_pages[h] for n, h in enumerate(fp.page_hashes, 1) if h in old_pages}
+        changed = [n for n in range(1, len(fp.page_hashes) + 1) if n not in page_map]
+        return Match(candidate, score, page_map, changed)
+
+    def summary(self, chunk_key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary FROM summaries WHERE chunk = ?", (chunk_key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE summaries SET used = ? WHERE chunk = ?", (time.time(), chunk_key))
+        self._count("summary_hits" if row is not None else "summary_misses")
+        return row[0] if row is not None else None
+
+    def set_summary(self, chunk_key, summary):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (chunk_key, summary, time.time()))
+            conn.execute(
+                "DELETE FROM summaries WHERE chunk IN ("
+                " SELECT chunk FROM summaries ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (SUMMARY_ITEMS,),
+            )
+
+    def stats(self):
+        """Lookup and reuse counters; hit_rate is the share of new documents that matched an earlier version."""
+        with self._lock:
+            stats = dict(self._stats)
+        new = stats["lookups"] - stats["exact"]
+        stats["hit_rate"] = stats["near"] / new if new else 0.0
+        summaries = stats["summary_hits"] + stats["summary_misses"]
+        stats["summary_hit_rate"] = stats["summary_hits"] / summaries if summaries else 0.0
+        return stats
+
+
+def chunk_key(chunk):
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_index():
+    """Returns the process-wide index, opening its database on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = NearDupIndex()
+        return _default
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+CACHE_DIR = os.environ.get(
+    "COGNIFAST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cognifast_cache")
+)
+DISK_LIMIT_BYTES = int(os.environ.get("COGNIFAST_PDF_CACHE_BYTES", 512 * 1024 * 1024))
+HOT_LIMIT_ITEMS = int(os.environ.get("COGNIFAST_PDF_CACHE_HOT_ITEMS", 32))
+
+
+def document_key(data):
+    """Returns the content hash used to address an uploaded document."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PdfTextCache:
+    """Two-tier (memory, then disk) LRU cache of extracted page text keyed by document hash."""
+
+    def __init__(self, directory=None, max_bytes=DISK_LIMIT_BYTES, hot_items=HOT_LIMIT_ITEMS):
+        self.directory = os.path.join(directory or CACHE_DIR, "pdf_text")
+        self.max_bytes = max_bytes
+        self.hot_items = hot_items
+        self._hot = OrderedDict()
+        self._lock = threading.Lock()
+        self.hot_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached list of page strings for key, or None."""
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                self.hot_hits += 1
+                return self._hot[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pages = json.load(f)
+            os.utime(path)  # Bump recency for disk LRU eviction
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, pages)
+        return pages
+
+    def put(self, key, pages):
+        """Stores the extracted pages under key in both tiers."""
+        with self._lock:
+            self._remember(key, pages)
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(pages, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict_disk()
+
+    def _remember(self, key, pages):
+        self._hot[key] = pages
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_items:
+            self._hot.popitem(last=False)
+
+    def _evict_disk(self):
+        """Deletes least recently used entries until the store fits in max_bytes."""
+        try:
+            entries = [
+                e for e in os.scandir(self.directory)
+                if e.is_file() and e.name.endswith(".json")
+            ]
+        except OSError:
+            return
+        entries = sorted(((e.stat(), e.path) for e in entries), key=lambda x: x[0].st_mtime)
+        total = sum(st.st_size for st, _ in entries)
+        for st, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= st.st_size
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drops every entry from both tiers."""
+        with self._lock:
+            self._hot.clear()
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+
+    def stats(self):
+        """Returns hit and miss counters."""
+        with self._lock:
+            return {
+                "hot_hits": self.hot_hits,
+                "disk_hits": self.disk_hits,
+                "hits": self.hot_hits + self.disk_hits,
+                "misses": self.misses,
+                "hot_items": len(self._hot),
+            }
+
+
+default_cache = PdfTextCache()
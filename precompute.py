@@ -0,0 +1,90 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import scheduler
+
+
+WORKERS = int(os.environ.get("COGNIFAST_PRECOMPUTE_WORKERS", 4))
+# Seconds after the upload during which speculative work may still start.
+BUDGET_SECONDS = float(os.environ.get("COGNIFAST_PRECOMPUTE_BUDGET", 60))
+# Artefacts warmed after an upload, in priority order; empty disables precomputation.
+ARTEFACTS = tuple(
+    name.strip()
+    for name in os.environ.get("COGNIFAST_PRECOMPUTE", "index,flashcards,quiz,audio_script").split(",")
+    if name.strip()
+)
+
+logger = logging.getLogger("cognifast.precompute")
+
+
+class Cancelled(Exception):
+    """Raised inside a speculative task whose session no longer wants it."""
+
+
+class Precompute:
+    """Speculative work for one session's document, run on a shared background pool.
+
+    Tasks are submitted in order, so with a busy pool the first ones start first.
+    A task that has not started before the budget runs out is skipped. Their LLM
+    calls run at SPECULATIVE priority, so they leave part of the key's quota to
+    the user and stop at the next call once cancelled. result() never blocks: it
+    returns None until the artefact is ready.
+    """
+
+    def __init__(self, tasks, budget=BUDGET_SECONDS, executor=None):
+        executor = executor or _executor
+        self.deadline = time.monotonic() + budget
+        self._cancelled = threading.Event()
+        self._futures = {name: executor.submit(self._run, name, fn) for name, fn in tasks.items()}
+
+    def _run(self, name, fn):
+        if self._cancelled.is_set():
+            raise Cancelled(name)
+        if time.monotonic() > self.deadline:
+            raise TimeoutError(f"precompute budget exhausted before {name} started")
+        try:
+            with scheduler.speculative(self._cancelled):
+                result = fn()
+        except scheduler.Cancelled:
+            raise Cancelled(name) from None
+        except Exception as e:
+            logger.info("speculative %s failed: %s", name, e)
+            raise
+        if self._cancelled.is_set():
+            raise Cancelled(name)
+        return result
+
+    def result(self, name):
+        """Returns the finished artefact, or None if it is pending, failed or cancelled."""
+        future = self._futures.get(name)
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def status(self):
+        """Returns the state of every task: pending, running, done, failed or cancelled."""
+        states = {}
+        for name, future in self._futures.items():
+            if future.cancelled() or (future.done() and isinstance(future.exception(), Cancelled)):
+                states[name] = "cancelled"
+            elif future.done():
+                states[name] = "failed" if future.exception() is not None else "done"
+            else:
+                states[name] = "running" if future.running() else "pending"
+        return states
+
+    def cancel(self):
+        """Drops queued tasks; running ones stop at their next LLM call and their results are discarded."""
+        self._cancelled.set()
+        for future in self._futures.values():
+            future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="precompute")
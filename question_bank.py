@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_cache import CACHE_DIR
+
+
+# Unserved questions per difficulty below which a background refill starts.
+LOW_WATER = int(os.environ.get("COGNIFAST_BANK_LOW_WATER", 10))
+# Word-set overlap above which two questions count as the same question.
+DUPLICATE_SIMILARITY = 0.8
+BANK_ITEMS = 32
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+logger = logging.getLogger("cognifast.question_bank")
+
+
+def _words(text):
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def question_id(question):
+    """Returns a stable id for a question, insensitive to case and punctuation."""
+    normalized = " ".join(_WORD_RE.findall(question.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class QuestionBank:
+    """De-duplicated, difficulty- and page-tagged quiz questions for one document.
+
+    Persisted as JSON next to the extracted text cache, so a document's bank
+    survives restarts and is shared by every session that opens it.
+    """
+
+    def __init__(self, key, directory=None):
+        self.key = key
+        self.path = os.path.join(directory or CACHE_DIR, "question_bank", f"{key}.json")
+        self.cursor = 0  # Next chunk of the document to generate questions from
+        self.stale_pages = set()  # Pages with no questions yet after reusing an earlier version's bank
+        self._questions = []
+        self._ids = set()
+        self._word_sets = []
+        self._lock = threading.Lock()
+        self._refill = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.cursor = data.get("cursor", 0)
+        self.stale_pages = set(data.get("stale_pages", ()))
+        for question in data.get("questions", []):
+            self._insert(question)
+
+    def save(self):
+        with self._lock:
+            payload = {"cursor": self.cursor, "stale_pages": sorted(self.stale_pages), "questions": list(self._questions)}
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _insert(self, question):
+        qid = question_id(question["question"])
+        if qid in self._ids:
+            return False
+        words = _words(question["question"])
+        for other in self._word_sets:
+            union = len(words | other)
+            if union and len(words & other) / union >= DUPLICATE_SIMILARITY:
+                return False
+        question = dict(question, id=qid)
+        question.setdefault("difficulty", "Medium")
+        self._questions.append(question)
+        self._ids.add(qid)
+        self._word_sets.append(words)
+        return True
+
+    def add(self, questions):
+        """Adds validated quiz items, skipping near-duplicates; returns how many were new."""
+        with self._lock:
+            added = sum(self._insert(q) for q in questions)
+        if added:
+            self.save()
+        return added
+
+    def seed(self, questions, page_map, changed_pages):
+        """Reuses an earlier version's questions for the pages that did not change.
+
+        page_map maps each unchanged page's new number to its old one. Questions are
+        moved to their page's new number; those on changed pages are dropped, and the
+        changed pages are generated first by later fills.
+        """
+        new_pages = {old: new for new, old in page_map.items()}
+        kept = [
+            dict(q, page=new_pages[q["page"]]) for q in questions
+            if q.get("page") in new_pages
+        ]
+        with self._lock:
+            added = sum(self._insert({k: v for k, v in q.items() if k != "id"}) for q in kept)
+            self.stale_pages.update(changed_pages)
+        self.save()
+        return added
+
+    def next_stale(self, chunks, n):
+        """Picks up to n chunk indices covering stale pages and marks those pages covered.
+
+        chunks is a list of (first_page, last_page) ranges.
+        """
+        with self._lock:
+            indices = [
+                i for i, (first, last) in enumerate(chunks)
+                if any(first <= page <= last for page in self.stale_pages)
+            ][:n]
+            for i in indices:
+                first, last = chunks[i]
+                self.stale_pages -= set(range(first, last + 1))
+        return indices
+
+    def __len__(self):
+        with self._lock:
+            return len(self._questions)
+
+    def questions(self):
+        with self._lock:
+            return list(self._questions)
+
+    def available(self, level=None, exclude=()):
+        """Counts questions not in exclude, optionally only those at level."""
+        with self._lock:
+            return sum(
+                1 for q in self._questions
+                if q["id"] not in exclude and (level is None or q["difficulty"] == level)
+            )
+
+    def draw(self, n, level, exclude=()):
+        """Picks up to n random questions at level that are not in exclude."""
+        with self._lock:
+            pool = [q for q in self._questions if q["id"] not in exclude and q["difficulty"] == level]
+        return [dict(q) for q in random.sample(pool, min(n, len(pool)))]
+
+    def next_chunks(self, n, total):
+        """Reserves the next n chunk indices out of total, wrapping around the document."""
+        with self._lock:
+            indices = [(self.cursor + i) % total for i in range(min(n, total))]
+            self.cursor = (self.cursor + len(indices)) % total
+        return indices
+
+    @property
+    def refilling(self):
+        with self._lock:
+            return self._refill is not None and not self._refill.done()
+
+    def refill_async(self, fill):
+        """Runs fill() on the shared background pool unless a refill is already running."""
+        with self._lock:
+            if self._refill is not None and not self._refill.done():
+                return self._refill
+            self._refill = _executor.submit(fill)
+            self._refill.add_done_callback(self._log_failure)
+            return self._refill
+
+    def _log_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("question bank refill for %s failed: %s", self.key, future.exception())
+
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="question-bank")
+_banks = OrderedDict()
+_banks_lock = threading.Lock()
+
+
+def get_bank(key):
+    """Returns the process-wide bank for a document key, loading it from disk if needed."""
+    with _banks_lock:
+        bank = _banks.get(key)
+        if bank is None:
+            bank = _banks[key] = QuestionBank(key)
+        _banks.move_to_end(key)
+        while len(_banks) > BANK_ITEMS:
+            _banks.popitem(last=False)
+        return bank
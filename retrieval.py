@@ -0,0 +1,117 @@
+import re
+
+import numpy as np
+
+from text_prep import count_tokens
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercases and splits text into alphanumeric terms."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text, chunk_chars=1200, overlap=200):
+    """Splits text into overlapping chunks, preferring to cut at whitespace."""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_chars, length)
+        if end < length:
+            cut = text.rfind(" ", start + chunk_chars // 2, end)
+            if cut != -1:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    """In-memory BM25 index over text chunks, stored as term-sorted postings arrays."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(self.chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(self.chunks):
+            ids = [self.vocab.setdefault(t, len(self.vocab)) for t in tokenize(chunk)]
+            lengths[doc_id] = len(ids)
+            if not ids:
+                continue
+            unique, counts = np.unique(np.asarray(ids, dtype=np.int64), return_counts=True)
+            term_ids.append(unique)
+            doc_ids.append(np.full(len(unique), doc_id, dtype=np.int64))
+            tfs.append(counts.astype(np.float32))
+
+        if term_ids:
+            term_ids = np.concatenate(term_ids)
+            order = np.argsort(term_ids, kind="stable")
+            self._terms = term_ids[order]
+            self._docs = np.concatenate(doc_ids)[order]
+            self._tfs = np.concatenate(tfs)[order]
+        else:
+            self._terms = np.zeros(0, dtype=np.int64)
+            self._docs = np.zeros(0, dtype=np.int64)
+            self._tfs = np.zeros(0, dtype=np.float32)
+
+        self._indptr = np.searchsorted(self._terms, np.arange(len(self.vocab) + 1))
+        n_docs = max(len(self.chunks), 1)
+        df = np.diff(self._indptr).astype(np.float32)
+        self._idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avgdl = float(lengths.mean()) if len(lengths) else 1.0
+        self._norm = k1 * (1.0 - b + b * lengths / max(avgdl, 1.0))
+
+    def scores(self, query):
+        """Returns the BM25 score of every chunk for query."""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self._indptr[term_id], self._indptr[term_id + 1]
+            docs, tf = self._docs[lo:hi], self._tfs[lo:hi]
+            scores[docs] += self._idf[term_id] * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+        return scores
+
+    def search(self, query, k=5):
+        """Returns up to k (chunk_index, score) pairs, best first."""
+        if not self.chunks:
+            return []
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def context_for(self, query, k=5, token_budget=1500):
+        """Joins the most relevant chunks for query without exceeding token_budget."""
+        hits = self.search(query, k)
+        if not hits:
+            # Nothing matched lexically, so fall back to the start of the document.
+            hits = [(i, 0.0) for i in range(min(k, len(self.chunks)))]
+
+        selected, used = [], 0
+        for idx, _ in hits:
+            cost = count_tokens(self.chunks[idx])
+            if used + cost > token_budget:
+                continue
+            selected.append(idx)
+            used += cost
+        # Keep document order so neighbouring passages read naturally.
+        return "\n---\n".join(self.chunks[i] for i in sorted(selected))
+
+
+def build_index(text, chunk_chars=1200, overlap=200):
+    """Chunks a document and builds its retrieval index."""
+    return BM25Index(chunk_text(text, chunk_chars, overlap))
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+FAST_MODEL = os.environ.get("COGNIFAST_MODEL_FAST", "llama-3.1-8b-instant")
+QUALITY_MODEL = os.environ.get("COGNIFAST_MODEL_QUALITY", "llama-3.3-70b-versatile")
+# Features whose output is worth the larger model, e.g. "diagram,quiz"; others always use the fast one.
+# Empty by default: the larger model costs more and draws on a separate quota.
+QUALITY_FEATURES = frozenset(
+    name.strip() for name in os.environ.get("COGNIFAST_QUALITY_FEATURES", "").split(",") if name.strip()
+)
+# Longer prompts go to the fast model even for quality features: the large one costs too much per call.
+QUALITY_MAX_PROMPT_TOKENS = int(os.environ.get("COGNIFAST_QUALITY_MAX_PROMPT_TOKENS", 3000))
+
+
+def _parse_budgets(value):
+    budgets = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            budgets[name.strip()] = float(seconds)
+    return budgets
+
+
+# Seconds each feature may wait for a response before a duplicate is considered; unlisted features never hedge.
+LATENCY_BUDGETS = _parse_budgets(os.environ.get("COGNIFAST_LATENCY_BUDGETS", "tutor=3,quiz=8"))
+HEDGE_QUANTILE = float(os.environ.get("COGNIFAST_HEDGE_QUANTILE", 0.95))
+# At most this fraction of a feature's recent calls may be duplicated, which bounds the extra cost.
+MAX_HEDGE_RATE = float(os.environ.get("COGNIFAST_MAX_HEDGE_RATE", 0.1))
+# Recent calls per (feature, model) used for the latency quantile and the hedge rate.
+WINDOW = 200
+MIN_SAMPLES = 20
+
+logger = logging.getLogger("cognifast.routing")
+
+
+def choose_model(feature, prompt_tokens):
+    """Picks the model for a call from the feature's quality needs and the prompt size."""
+    if feature in QUALITY_FEATURES and prompt_tokens <= QUALITY_MAX_PROMPT_TOKENS:
+        return QUALITY_MODEL
+    return FAST_MODEL
+
+
+class Cancelled(Exception):
+    """Raised inside an attempt that lost the race before it was sent."""
+
+
+class Hedger:
+    """Races a duplicate request against a slow one and keeps the first valid response.
+
+    The duplicate is sent once the original has taken longer than the feature's
+    recent p95 latency, capped at its latency budget. A loser that has not been
+    sent yet is dropped; one already in flight is told to stop through its
+    cancel event and its late result is handed to ``discard``.
+
+    Attempts run on a shared pool, so any wait for quota happens in the caller's
+    thread through ``admit`` before an attempt is submitted; a throttled key
+    never holds pool threads that other keys' calls need.
+    """
+
+    def __init__(self, budgets=LATENCY_BUDGETS, quantile=HEDGE_QUANTILE, max_rate=MAX_HEDGE_RATE,
+                 window=WINDOW, min_samples=MIN_SAMPLES, busy=None, executor=None):
+        self.budgets = dict(budgets)
+        self.quantile = quantile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.busy = busy  # Returns True while delays are our own queueing, not the upstream's
+        self._window = window
+        self._latencies = {}  # (feature, model) -> recent winning latencies
+        self._hedged = {}  # feature -> recent calls, True where a duplicate was sent
+        self._stats = {"calls": 0, "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+        self._executor = executor or ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+    def delay(self, feature, model):
+        """Seconds to wait before hedging a call, or None if the feature never hedges."""
+        budget = self.budgets.get(feature)
+        if budget is None:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get((feature, model), ()))
+        if len(samples) < self.min_samples:
+            return budget
+        p = samples[min(len(samples) - 1, int(self.quantile * len(samples)))]
+        return min(p, budget)
+
+    def _admit_hedge(self, feature):
+        if self.busy is not None and self.busy():
+            return False
+        with self._lock:
+            recent = self._hedged.get(feature, ())
+            return sum(recent) < self.max_rate * max(len(recent), self.min_samples)
+
+    def _record(self, feature, model, seconds, hedged, hedge_won):
+        with self._lock:
+            self._latencies.setdefault((feature, model), deque(maxlen=self._window)).append(seconds)
+            self._hedged.setdefault(feature, deque(maxlen=self._window)).append(hedged)
+            self._stats["calls"] += 1
+            self._stats["hedges"] += hedged
+            self._stats["hedge_wins"] += hedge_won
+
+    def call(self, feature, model, attempt, discard=None, event=None, admit=None, valid=None):
+        """Returns attempt(cancel_event, admitted)'s result, hedging it if it is slow.
+
+        With valid, the first result it accepts wins; a result that fails it only
+        wins when no attempt passes, so a fast malformed answer does not beat a
+        good hedge.
+
+        attempt must be safe to run twice at once and should give up early once its
+        cancel event is set. admit(blocking) takes the quota for one attempt:
+        blocking, it waits until it has; otherwise it returns whether the quota was
+        free right away. admitted tells an attempt whether admit already ran for it.
+        """
+        delay = self.delay(feature, model)
+        # Latency is what the caller sees: from the original request to the winning response
+        started = time.monotonic()
+        if delay is None:
+            result = attempt(threading.Event(), False)
+            self._record(feature, model, time.monotonic() - started, False, False)
+            return result
+
+        if admit is not None:
+            admit(True)
+        cancels = [threading.Event()]
+        futures = [self._executor.submit(attempt, cancels[0], admit is not None)]
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._admit_hedge(feature) and (admit is None or admit(False)):
+            logger.info("hedging %s call to %s after %.2fs", feature, model, delay)
+            cancels.append(threading.Event())
+            futures.append(self._executor.submit(attempt, cancels[1], admit is not None))
+
+        def accepted(future):
+            return future.exception() is None and (valid is None or valid(future.result()))
+
+        winner, pending = None, set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Prefer the original when both finish together
+            winner = next((f for f in futures if f in done and accepted(f)), None)
+        if winner is None:
+            # Nothing passed valid; the caller's own repair handles the original's answer
+            winner = next((f for f in futures if f.exception() is None), None)
+
+        for future, cancel in zip(futures, cancels):
+            if future is winner:
+                continue
+            cancel.set()
+            if not future.cancel() and discard is not None:
+                future.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+
+        hedged = len(futures) > 1
+        if event is not None:
+            event["model"] = model
+            event["hedged"] = hedged
+        if winner is None:
+            futures[0].result()  # Every attempt failed; raise the original's error
+        result = winner.result()
+        elapsed = time.monotonic() - started
+        hedge_won = winner is not futures[0]
+        if event is not None and hedged:
+            event["hedge_won"] = hedge_won
+        self._record(feature, model, elapsed, hedged, hedge_won)
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedges"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+
+# Quota is checked per key by the caller's admit, which skips a hedge that would have to queue.
+hedger = Hedger()
@@ -0,0 +1,335 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+import openai
+
+
+INTERACTIVE = 0
+BULK = 1
+# Work nobody asked for yet (precompute); only admitted while the buckets keep a reserve.
+SPECULATIVE = 2
+
+REQUESTS_PER_MINUTE = float(os.environ.get("COGNIFAST_RPM", 30))
+TOKENS_PER_MINUTE = float(os.environ.get("COGNIFAST_TPM", 6000))
+MAX_RETRIES = int(os.environ.get("COGNIFAST_MAX_RETRIES", 4))
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+# Seconds a key's scheduler is kept without calls.
+IDLE_TTL = 10 * 60
+# Share of each bucket that speculative calls leave for the user's own requests.
+SPECULATIVE_RESERVE = float(os.environ.get("COGNIFAST_SPECULATIVE_RESERVE", 0.5))
+
+_RETRYABLE = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class ServiceBusyError(Exception):
+    """Raised when a call is still rate limited after every retry."""
+
+
+class RequestTooLargeError(ValueError):
+    """Raised for a call that needs more than a whole minute's quota; the API would reject it too."""
+
+
+class Cancelled(Exception):
+    """Raised for a speculative call whose work was cancelled before it was sent."""
+
+
+# Cancel event of the speculative work running in this context, or None.
+_speculation = contextvars.ContextVar("speculation", default=None)
+
+
+@contextlib.contextmanager
+def speculative(cancelled):
+    """Runs the calls made inside the block at SPECULATIVE priority.
+
+    Once the cancelled event is set, every further call raises Cancelled instead
+    of being sent, including calls already waiting for quota.
+    """
+    token = _speculation.set(cancelled)
+    try:
+        yield
+    finally:
+        _speculation.reset(token)
+
+
+def propagate(fn):
+    """Wraps fn so a thread pool runs it inside the caller's speculative block, if any."""
+    cancelled = _speculation.get()
+    if cancelled is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with speculative(cancelled):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+class TokenBucket:
+    """Continuously refilling bucket; ``per_minute`` units, bursting up to one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def check(self, amount):
+        if amount > self.capacity:
+            raise RequestTooLargeError(
+                f"A request for {amount:g} exceeds the limit of {self.capacity:g} per minute; split it into smaller ones."
+            )
+
+    def delay_for(self, amount, now):
+        """Seconds until amount is available (0 when it already is)."""
+        self.check(amount)
+        self._refill(now)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        # May go below zero when settling a call that used more than estimated
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+def _retry_after(error):
+    """Reads the server's Retry-After hint in seconds, if it sent one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Scheduler:
+    """Request/token quota of one API key, with priority admission and retrying.
+
+    Callers queue by priority (interactive, bulk, speculative, then FIFO) and are
+    admitted once both the request and the token bucket allow; speculative calls
+    additionally wait until SPECULATIVE_RESERVE of each bucket would be left. A
+    429 pauses admission for every caller of the key, not only the one that
+    received it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        max_retries=MAX_RETRIES,
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._stats = {"admitted": 0, "retries": 0, "throttled": 0, "failed": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+    def _delay(self, tokens, priority, now):
+        delay = max(
+            self._paused_until - now,
+            self.requests.delay_for(1, now),
+            self.tokens.delay_for(tokens, now),
+        )
+        if priority == SPECULATIVE:
+            delay = max(
+                delay,
+                self.requests.delay_for(min(self.requests.capacity, 1 + self.requests.capacity * SPECULATIVE_RESERVE), now),
+                self.tokens.delay_for(min(self.tokens.capacity, tokens + self.tokens.capacity * SPECULATIVE_RESERVE), now),
+            )
+        return delay
+
+    def acquire(self, tokens, priority=BULK):
+        """Blocks until the call may be sent; returns the time spent waiting.
+
+        Inside a speculative() block the call is queued as SPECULATIVE and raises
+        Cancelled once the block's work is cancelled.
+        """
+        self.tokens.check(tokens)
+        cancelled = _speculation.get()
+        if cancelled is not None:
+            priority = SPECULATIVE
+        entry = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                    raise Cancelled()
+                # Speculative waiters wake up periodically to notice a cancellation
+                timeout = 1.0 if cancelled is not None else None
+                if self._queue[0] == entry:
+                    delay = self._delay(tokens, priority, time.monotonic())
+                    if delay <= 0:
+                        heapq.heappop(self._queue)
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait(timeout=delay if timeout is None else min(delay, timeout))
+                else:
+                    self._cond.wait(timeout=timeout)
+
+            waited = time.monotonic() - started
+            self._stats["admitted"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        return waited
+
+    def try_acquire(self, tokens, priority=BULK):
+        """Takes the quota for a call only if nobody is queued and it is available now."""
+        cancelled = _speculation.get()
+        if cancelled is not None:
+            if cancelled.is_set():
+                raise Cancelled()
+            priority = SPECULATIVE
+        with self._cond:
+            if self._queue or self._delay(tokens, priority, time.monotonic()) > 0:
+                return False
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._stats["admitted"] += 1
+        return True
+
+    def settle(self, estimated, actual):
+        """Corrects the token bucket once the real usage of a call is known."""
+        with self._cond:
+            if actual < estimated:
+                self.tokens.give_back(estimated - actual)
+            else:
+                self.tokens.take(actual - estimated)
+
+    def _pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying sessions from hitting the API in lockstep.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, tokens, priority=BULK, acquired=False):
+        """Runs fn() under the quota, retrying transient failures with jittered backoff.
+
+        With acquired, the caller already took the first attempt's quota through
+        acquire() or try_acquire().
+        """
+        attempt = 0
+        while True:
+            if not acquired:
+                self.acquire(tokens, priority)
+            acquired = False
+            try:
+                return fn()
+            except _RETRYABLE as e:
+                if attempt >= self.max_retries:
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    if isinstance(e, openai.RateLimitError):
+                        raise ServiceBusyError(
+                            "The AI service is busy right now. Please try again in a moment."
+                        ) from e
+                    raise
+                delay = _retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    with self._cond:
+                        self._stats["throttled"] += 1
+                    if delay is not None:
+                        self._pause(delay)
+                delay = self._backoff(attempt) if delay is None else delay + self._backoff(0)
+                with self._cond:
+                    self._stats["retries"] += 1
+                time.sleep(delay)
+                attempt += 1
+
+    def stats(self):
+        """Returns queue depth per priority plus admission, wait and retry counters."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._queue)
+            stats["queue_interactive"] = sum(1 for p, _ in self._queue if p == INTERACTIVE)
+            stats["queue_bulk"] = stats["queue_depth"] - stats["queue_interactive"]
+            stats["wait_avg"] = stats["wait_total"] / stats["admitted"] if stats["admitted"] else 0.0
+            return stats
+
+
+class SchedulerRegistry:
+    """One Scheduler per API key, since each key has its own quota upstream.
+
+    Users with different keys never wait on each other's calls, and a 429 only
+    pauses the key that received it. Keys are the hashes used by the client
+    registry. Schedulers idle for longer than idle_ttl are dropped; their
+    buckets would have refilled by then anyway.
+    """
+
+    def __init__(self, factory=Scheduler, idle_ttl=IDLE_TTL):
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self._schedulers = {}  # key -> [scheduler, last_used]
+        self._retired = {"admitted": 0, "retries": 0, "throttled": 0, "failed": 0, "wait_total": 0.0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the scheduler for an API key hash, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._schedulers.get(key)
+            if entry is None:
+                entry = self._schedulers[key] = [self.factory(), now]
+            entry[1] = now
+            return entry[0]
+
+    def _evict_idle(self, now):
+        # Called with the lock held; totals are kept so the counters never go backwards
+        for key, (scheduler, last_used) in list(self._schedulers.items()):
+            if now - last_used > self.idle_ttl:
+                stats = scheduler.stats()
+                if stats["queue_depth"]:
+                    continue
+                for name in self._retired:
+                    self._retired[name] += stats[name]
+                del self._schedulers[key]
+
+    def stats(self):
+        """Scheduler.stats() summed over every key, plus the number of keys."""
+        with self._lock:
+            per_key = [scheduler.stats() for scheduler, _ in self._schedulers.values()]
+            stats = dict(self._retired)
+        for name in ("queue_depth", "queue_interactive", "queue_bulk"):
+            stats[name] = sum(s[name] for s in per_key)
+        for name in self._retired:
+            stats[name] += sum(s[name] for s in per_key)
+        stats["wait_max"] = max((s["wait_max"] for s in per_key), default=0.0)
+        stats["wait_avg"] = stats["wait_total"] / stats["admitted"] if stats["admitted"] else 0.0
+        stats["keys"] = len(per_key)
+        return stats
+
+
+schedulers = SchedulerRegistry()
@@ -0,0 +1,185 @@
+import difflib
+import json
+import re
+
+
+QUIZ_KEYS = ("quiz", "questions", "items")
+FLASHCARD_KEYS = ("flashcards", "concepts", "cards", "items")
+
+_QUESTION_ALIASES = ("question", "q", "prompt", "text", "query")
+_OPTIONS_ALIASES = ("options", "choices", "answers", "alternatives")
+_ANSWER_ALIASES = ("answer", "correct", "correct_answer", "correctAnswer", "correct_option", "solution")
+_CONCEPT_ALIASES = ("concept", "term", "name", "title", "keyword")
+_DEFINITION_ALIASES = ("definition", "meaning", "description", "explanation", "answer")
+_DIFFICULTY_ALIASES = ("difficulty", "level")
+_PAGE_ALIASES = ("page", "source_page", "page_number")
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_LETTER_RE = re.compile(r"^\(?([A-Fa-f])[\).:]?(?:\s|$)")
+
+
+def _close_truncated(raw):
+    """Cuts a truncated JSON document after its last complete value and closes it."""
+    stack, in_string, escaped, last_complete = [], False, False, None
+    for i, ch in enumerate(raw):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+        elif ch in "]}" and stack:
+            stack.pop()
+            last_complete = (i, list(stack))
+    if last_complete is None:
+        return None
+    end, open_brackets = last_complete
+    return raw[:end + 1] + "".join(reversed(open_brackets))
+
+
+def loads_lenient(raw):
+    """Parses model JSON, repairing code fences, smart quotes, trailing commas and truncation."""
+    text = _FENCE_RE.sub("", raw.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    text = text.replace("“", '"').replace("”", '"')
+    start = min((i for i in (text.find("{"), text.find("[")) if i != -1), default=-1)
+    if start != -1:
+        text = text[start:]
+    text = _TRAILING_COMMA_RE.sub(r"\1", text)
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    closed = _close_truncated(text)
+    if closed is not None:
+        try:
+            return json.loads(_TRAILING_COMMA_RE.sub(r"\1", closed))
+        except ValueError:
+            pass
+    raise ValueError("The model did not return valid JSON.")
+
+
+def extract_items(data, keys):
+    """Finds the list of items in a response, whatever top-level key the model chose."""
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        return []
+    for key in keys:
+        if isinstance(data.get(key), list):
+            return data[key]
+    for value in data.values():
+        if isinstance(value, list):
+            return value
+    return [data]  # A single item returned without a wrapper
+
+
+def _pick(item, aliases):
+    lowered = {str(k).lower(): v for k, v in item.items()}
+    for alias in aliases:
+        if alias.lower() in lowered:
+            return lowered[alias.lower()]
+    return None
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else None
+
+
+def _match_answer(answer, options):
+    """Maps the model's answer onto one of the options, or returns None."""
+    if isinstance(answer, int) and not isinstance(answer, bool):
+        return options[answer] if 0 <= answer < len(options) else None
+    answer = _clean(answer)
+    if not answer:
+        return None
+    if answer in options:
+        return answer
+
+    folded = {o.casefold(): o for o in options}
+    if answer.casefold() in folded:
+        return folded[answer.casefold()]
+
+    letter = _LETTER_RE.match(answer)
+    if letter:
+        index = ord(letter.group(1).upper()) - ord("A")
+        rest = answer[letter.end():].strip()
+        if 0 <= index < len(options) and (not rest or rest.casefold() in options[index].casefold()):
+            return options[index]
+
+    contained = [o for o in options if answer.casefold() in o.casefold() or o.casefold() in answer.casefold()]
+    if len(contained) == 1:
+        return contained[0]
+    close = difflib.get_close_matches(answer, options, n=1, cutoff=0.75)
+    return close[0] if close else None
+
+
+def validate_quiz_item(item):
+    """Returns a repaired {question, options, answer} dict, or None if it cannot be saved."""
+    if not isinstance(item, dict):
+        return None
+    question = _clean(_pick(item, _QUESTION_ALIASES))
+    options = _pick(item, _OPTIONS_ALIASES)
+    if isinstance(options, dict):
+        options = list(options.values())
+    if not question or not isinstance(options, list):
+        return None
+
+    cleaned = []
+    for option in options:
+        option = _clean(option) if not isinstance(option, (int, float)) else str(option)
+        if option and option not in cleaned:
+            cleaned.append(option)
+    if not 2 <= len(cleaned) <= 6:
+        return None
+
+    answer = _match_answer(_pick(item, _ANSWER_ALIASES), cleaned)
+    if answer is None:
+        return None
+    result = {"question": question, "options": cleaned, "answer": answer}
+
+    # Optional tags, kept only when they are usable.
+    difficulty = _clean(_pick(item, _DIFFICULTY_ALIASES))
+    if difficulty and difficulty.capitalize() in DIFFICULTIES:
+        result["difficulty"] = difficulty.capitalize()
+    page = _pick(item, _PAGE_ALIASES)
+    if isinstance(page, str) and page.strip().isdigit():
+        page = int(page)
+    if isinstance(page, int) and not isinstance(page, bool) and page > 0:
+        result["page"] = page
+    return result
+
+
+def validate_flashcard(item):
+    """Returns a repaired {concept, definition} dict, or None if it cannot be saved."""
+    if not isinstance(item, dict):
+        return None
+    concept = _clean(_pick(item, _CONCEPT_ALIASES))
+    definition = _clean(_pick(item, _DEFINITION_ALIASES))
+    if not concept or not definition:
+        return None
+    return {"concept": concept, "definition": definition}
+
+
+def parse_items(raw, keys, validate):
+    """Parses a response and returns (valid_items, rejected_count)."""
+    try:
+        items = extract_items(loads_lenient(raw), keys)
+    except ValueError:
+        return [], 0
+    valid = [v for v in (validate(item) for item in items) if v is not None]
+    return valid, len(items) - len(valid)
@@ -0,0 +1,57 @@
+import pytest
+
+from diagrams import DotError, parse_dot, prune, validate_dot
+
+
+def _tree(children=6, grandchildren=8):
+    lines = ["digraph G {"]
+    lines += [f"  root -> a{i};" for i in range(children)]
+    lines += [f"  a{i} -> b{i}_{j};" for i in range(children) for j in range(grandchildren)]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def test_validate_dot_round_trips_a_small_graph():
+    dot, info = validate_dot('digraph G { a [label="Cell"]; a -> b; b -> "c d"; }')
+    assert info == {"nodes": 3, "edges": 2, "pruned": 0}
+    assert '"a" ["label"="Cell"];' in dot
+    assert '"b" -> "c d";' in dot
+    assert validate_dot(dot)[0] == dot
+
+
+def test_validate_dot_keeps_html_labels_unquoted():
+    dot, _ = validate_dot("digraph { a [label=<<b>Cell</b>>]; }")
+    assert '"label"=<<b>Cell</b>>' in dot
+
+
+@pytest.mark.parametrize("text", ["", "not a graph", "digraph G { a -> ; }", "digraph G { a -> b;"])
+def test_validate_dot_rejects_broken_text(text):
+    with pytest.raises(DotError):
+        validate_dot(text)
+
+
+def test_prune_leaves_small_graphs_alone():
+    graph = parse_dot(_tree(2, 2))
+    assert prune(graph, max_nodes=40, max_edges=80) == 0
+    assert len(graph.nodes) == 7
+
+
+def test_prune_keeps_top_levels_within_limits():
+    graph = parse_dot(_tree())
+    removed = prune(graph, max_nodes=20, max_edges=40)
+    assert removed > 0
+    assert len(graph.nodes) <= 20
+    assert len(graph.edges) <= 40
+    assert "root" in graph.nodes
+    assert all(f"a{i}" in graph.nodes for i in range(6))
+    assert all(tail in graph.nodes and head in graph.nodes for tail, head, _ in graph.edges)
+
+
+def test_prune_keeps_summary_edges_when_edges_are_tight():
+    graph = parse_dot(_tree())
+    prune(graph, max_nodes=12, max_edges=8)
+    summaries = [n for n in graph.nodes if n.endswith("more)")]
+    assert summaries
+    assert len(graph.edges) <= 8
+    # Every "+N more" node stays attached to its parent
+    assert {head for _, head, _ in graph.edges} >= set(summaries)
@@ -0,0 +1,62 @@
+from question_bank import QuestionBank, question_id
+
+
+def _question(text, difficulty="Medium", page=1):
+    return {"question": text, "options": ["a", "b"], "answer": "a", "difficulty": difficulty, "page": page}
+
+
+def test_add_skips_exact_and_near_duplicates(tmp_path):
+    bank = QuestionBank("doc", directory=tmp_path)
+    added = bank.add([
+        _question("What organelle produces most of the cell's ATP?"),
+        _question("WHAT organelle produces most of the cell's ATP"),
+        _question("Which organelle produces most of the cell's ATP?"),
+        _question("What builds proteins from amino acids?"),
+    ])
+    assert added == 2
+    assert [q["id"] for q in bank.questions()] == [
+        question_id("What organelle produces most of the cell's ATP?"),
+        question_id("What builds proteins from amino acids?"),
+    ]
+    assert bank.add([_question("What builds proteins from amino acids?")]) == 0
+
+
+def test_added_questions_persist(tmp_path):
+    bank = QuestionBank("doc", directory=tmp_path)
+    bank.add([_question("What builds proteins?", difficulty="Hard")])
+    bank.next_chunks(2, 5)
+    bank.save()
+
+    reloaded = QuestionBank("doc", directory=tmp_path)
+    assert len(reloaded) == 1
+    assert reloaded.available("Hard") == 1
+    assert reloaded.cursor == 2
+
+
+def test_next_stale_picks_chunks_covering_stale_pages_once(tmp_path):
+    bank = QuestionBank("doc", directory=tmp_path)
+    bank.seed([], page_map={}, changed_pages={2, 9})
+    chunks = [(1, 3), (4, 6), (7, 9), (10, 12)]
+
+    assert bank.next_stale(chunks, 5) == [0, 2]
+    assert bank.stale_pages == set()
+    assert bank.next_stale(chunks, 5) == []
+
+
+def test_next_stale_respects_n(tmp_path):
+    bank = QuestionBank("doc", directory=tmp_path)
+    bank.seed([], page_map={}, changed_pages={2, 5, 11})
+    chunks = [(1, 3), (4, 6), (7, 9), (10, 12)]
+
+    assert bank.next_stale(chunks, 2) == [0, 1]
+    assert bank.stale_pages == {11}
+    assert bank.next_stale(chunks, 2) == [3]
+
+
+def test_seed_moves_unchanged_pages_and_drops_changed_ones(tmp_path):
+    bank = QuestionBank("doc", directory=tmp_path)
+    earlier = [_question("What builds proteins?", page=1), _question("What stores DNA?", page=2)]
+    # Page 1 of the earlier version is now page 2; its old page 2 changed
+    assert bank.seed(earlier, page_map={2: 1}, changed_pages={1, 3}) == 1
+    assert [(q["question"], q["page"]) for q in bank.questions()] == [("What builds proteins?", 2)]
+    assert bank.stale_pages == {1, 3}
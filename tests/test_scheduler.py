@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import RequestTooLargeError, Scheduler, TokenBucket
+
+
+def test_token_bucket_starts_full_and_refills_at_its_rate():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.delay_for(60, now) == 0.0
+    bucket.take(60)
+    assert bucket.delay_for(1, now) == pytest.approx(1.0)
+    assert bucket.delay_for(30, now + 10) == pytest.approx(20.0)
+    assert bucket.level == pytest.approx(10)
+
+
+def test_token_bucket_never_refills_past_capacity():
+    bucket = TokenBucket(60)
+    bucket.give_back(100)
+    assert bucket.level == 60
+    bucket.delay_for(1, bucket.updated + 600)
+    assert bucket.level == 60
+
+
+def test_token_bucket_can_go_negative_when_settling():
+    bucket = TokenBucket(60)
+    bucket.take(80)
+    assert bucket.level == -20
+    assert bucket.delay_for(10, bucket.updated) == pytest.approx(30.0)
+
+
+def test_token_bucket_rejects_more_than_a_minute():
+    bucket = TokenBucket(60)
+    with pytest.raises(RequestTooLargeError):
+        bucket.delay_for(61, bucket.updated)
+
+
+def test_oversize_acquire_raises_without_queueing():
+    s = Scheduler(requests_per_minute=60, tokens_per_minute=1000)
+    with pytest.raises(RequestTooLargeError):
+        s.acquire(1001)
+    assert s.stats()["queue_depth"] == 0
+
+
+def test_try_acquire_only_takes_available_quota():
+    s = Scheduler(requests_per_minute=60, tokens_per_minute=1000)
+    assert s.try_acquire(800)
+    assert not s.try_acquire(800)
+    assert s.stats()["admitted"] == 1
+
+
+def test_speculative_calls_leave_a_reserve():
+    s = Scheduler(requests_per_minute=600, tokens_per_minute=6000)
+    s.acquire(2500)
+    with scheduler.speculative(threading.Event()):
+        # 3500 left: enough for the call, not for the call plus half the bucket
+        assert not s.try_acquire(1000)
+    assert s.try_acquire(1000)
+
+
+def test_cancelled_speculative_call_leaves_the_queue():
+    s = Scheduler(requests_per_minute=600, tokens_per_minute=6000)
+    s.acquire(6000)
+    cancelled, outcome = threading.Event(), []
+
+    def speculative_call():
+        with scheduler.speculative(cancelled):
+            try:
+                s.acquire(100)
+                outcome.append("admitted")
+            except scheduler.Cancelled:
+                outcome.append("cancelled")
+
+    thread = threading.Thread(target=speculative_call)
+    thread.start()
+    while not s.stats()["queue_depth"]:
+        time.sleep(0.01)
+    cancelled.set()
+    thread.join(timeout=5)
+    assert outcome == ["cancelled"]
+    assert s.stats()["queue_depth"] == 0
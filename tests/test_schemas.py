@@ -0,0 +1,68 @@
+import pytest
+
+from schemas import FLASHCARD_KEYS, QUIZ_KEYS, _match_answer, parse_items, validate_flashcard, validate_quiz_item
+
+
+OPTIONS = ["Mitochondria", "Ribosome", "Golgi apparatus", "Nucleus"]
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("Ribosome", "Ribosome"),
+    ("ribosome", "Ribosome"),
+    (1, "Ribosome"),
+    ("B", "Ribosome"),
+    ("(b)", "Ribosome"),
+    ("B) Ribosome", "Ribosome"),
+    ("golgi", "Golgi apparatus"),
+    ("Nucleous", "Nucleus"),
+])
+def test_match_answer_maps_onto_an_option(answer, expected):
+    assert _match_answer(answer, OPTIONS) == expected
+
+
+@pytest.mark.parametrize("answer", [None, "", 4, -1, True, "E", "Chloroplast"])
+def test_match_answer_rejects_what_it_cannot_place(answer):
+    assert _match_answer(answer, OPTIONS) is None
+
+
+def test_parse_items_repairs_fenced_truncated_json():
+    raw = (
+        '```json\n{"quiz": [\n'
+        '{"q": "What makes ATP?", "choices": ["Mitochondria", "Ribosome"], "correct": "A", "level": "hard", "page": "3"},\n'
+        '{"question": "What makes proteins?", "options": ["Mitochondria", "Ribosome"], "answer": "Ribo'
+    )
+    valid, rejected = parse_items(raw, QUIZ_KEYS, validate_quiz_item)
+    assert valid == [{
+        "question": "What makes ATP?",
+        "options": ["Mitochondria", "Ribosome"],
+        "answer": "Mitochondria",
+        "difficulty": "Hard",
+        "page": 3,
+    }]
+    # The cut-off item is closed without its answer
+    assert rejected == 1
+
+
+def test_parse_items_counts_rejected_items():
+    raw = (
+        '{"questions": ['
+        '{"question": "Q1", "options": ["a", "b"], "answer": "a"},'
+        '{"question": "Q2", "options": ["a"], "answer": "a"},'
+        '{"question": "", "options": ["a", "b"], "answer": "a"},'
+        '{"question": "Q4", "options": ["a", "b"], "answer": "c"},'
+        ']}'
+    )
+    valid, rejected = parse_items(raw, QUIZ_KEYS, validate_quiz_item)
+    assert [item["question"] for item in valid] == ["Q1"]
+    assert rejected == 3
+
+
+def test_parse_items_accepts_a_bare_list_and_a_single_item():
+    valid, _ = parse_items('[{"term": "ATP", "meaning": "Energy carrier"}]', FLASHCARD_KEYS, validate_flashcard)
+    assert valid == [{"concept": "ATP", "definition": "Energy carrier"}]
+    valid, _ = parse_items('{"concept": "ATP", "definition": "Energy carrier"}', FLASHCARD_KEYS, validate_flashcard)
+    assert valid == [{"concept": "ATP", "definition": "Energy carrier"}]
+
+
+def test_parse_items_returns_nothing_for_non_json():
+    assert parse_items("Sorry, I cannot help with that.", QUIZ_KEYS, validate_quiz_item) == ([], 0)
@@ -0,0 +1,262 @@
+import hashlib
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+
+
+# Approximates the Llama 3 pre-tokenizer: contractions, letter runs with an optional
+# leading space, digit groups of up to three, punctuation runs and whitespace.
+_PIECE_RE = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)\b"
+    r"| ?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?[^\s\w]+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+",
+    re.IGNORECASE,
+)
+# A BPE merge table of ~128k entries covers most English words whole; longer or rarer
+# letter runs split into pieces of roughly this many characters.
+_CHARS_PER_SUBWORD = 5
+_WHOLE_WORD_CHARS = 8
+
+_PAGE_NUMBER_RE = re.compile(r"^\s*(?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+# Page numbers that say so ("Page 3", "3 of 10"), unlike a bare number.
+_PAGE_LABEL_RE = re.compile(
+    r"^\s*(?:page\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?|\d{1,4}\s*(?:of|/)\s*\d{1,4})\s*$", re.IGNORECASE
+)
+_HYPHEN_BREAK_RE = re.compile(r"(\w)-\n(\w)")
+_SPACES_RE = re.compile(r"[ \t\f\v\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_DIGITS_RE = re.compile(r"\d+")
+
+EDGE_LINES = 3
+CACHE_ITEMS = 32
+# Typical tokens per extracted line, used to space content-defined cut points.
+LINE_TOKENS = 12
+
+
+def _piece_tokens(piece):
+    core = piece.strip()
+    if not core or len(core) <= _WHOLE_WORD_CHARS or not core[0].isalpha():
+        return 1
+    return -(-len(core) // _CHARS_PER_SUBWORD)
+
+
+def count_tokens(text):
+    """Counts tokens offline with a Llama-3-style pre-tokenizer approximation."""
+    return sum(_piece_tokens(m.group()) for m in _PIECE_RE.finditer(text))
+
+
+def truncate_to_tokens(text, budget):
+    """Returns the longest prefix of text that fits in budget tokens."""
+    used = 0
+    for match in _PIECE_RE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > budget:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def split_by_tokens(text, max_tokens):
+    """Splits text into consecutive chunks of at most max_tokens, cutting at whitespace."""
+    chunks, start, used, last_space = [], 0, 0, None
+    for match in _PIECE_RE.finditer(text):
+        piece = match.group()
+        if piece.isspace():
+            last_space = match.start()
+        used += _piece_tokens(piece)
+        if used > max_tokens:
+            cut = last_space if last_space is not None and last_space > start else match.start()
+            if cut > start:
+                chunks.append(text[start:cut].strip())
+                start = cut
+            last_space = None
+            used = count_tokens(text[start:match.end()])
+    tail = text[start:].strip()
+    if tail:
+        chunks.append(tail)
+    return [c for c in chunks if c]
+
+
+def split_content_defined(text, target_tokens):
+    """Splits text into chunks of about target_tokens whose boundaries depend only on nearby lines.
+
+    Once a chunk holds half the target, it ends after any line whose hash selects it
+    as a cut point, and it always ends before reaching twice the target. An edit
+    therefore only changes the chunks around it, so unchanged passages of a revised
+    document split into exactly the same chunks as before.
+    """
+    divisor = max(2, target_tokens // 2 // LINE_TOKENS)
+    chunks, current, used = [], [], 0
+
+    def flush():
+        chunk = "\n".join(current).strip()
+        if chunk:
+            chunks.append(chunk)
+        current.clear()
+
+    for line in text.split("\n"):
+        cost = count_tokens(line) + 1
+        if cost > 2 * target_tokens:
+            flush()
+            chunks.extend(split_by_tokens(line, target_tokens))
+            used = 0
+            continue
+        if current and used + cost > 2 * target_tokens:
+            flush()
+            used = 0
+        current.append(line)
+        used += cost
+        if used >= target_tokens // 2 and zlib.crc32(line.strip().encode("utf-8")) % divisor == 0:
+            flush()
+            used = 0
+    flush()
+    return chunks
+
+
+def _line_key(line):
+    return _DIGITS_RE.sub("#", line.strip().lower())
+
+
+def _normalize(text):
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _HYPHEN_BREAK_RE.sub(r"\1\2", text)
+    text = _SPACES_RE.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def _strip_running_lines(pages):
+    split = [page.replace("\r\n", "\n").split("\n") for page in pages]
+    repeated = set()
+    if len(split) >= 3:
+        edge_counts, total_counts = Counter(), Counter()
+        for lines in split:
+            content = [l for l in lines if l.strip()]
+            edges = content[:EDGE_LINES] + content[-EDGE_LINES:]
+            edge_counts.update({_line_key(l) for l in edges})
+            total_counts.update(_line_key(l) for l in content)
+        threshold = max(3, len(split) // 2)
+        # A real running header appears about once per page; lines that are also
+        # common in page bodies are content that merely looks alike once digits go.
+        repeated = {
+            key for key, count in edge_counts.items()
+            if count >= threshold and total_counts[key] <= 2 * count
+        }
+
+    cleaned = []
+    for lines in split:
+        # Only the top and bottom of a page carry page numbers; a number alone
+        # on a line elsewhere is content (a table cell, a step, a year).
+        content = [i for i, line in enumerate(lines) if line.strip()]
+        edges = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+        kept = [
+            line for i, line in enumerate(lines)
+            if not (i in edges and _PAGE_NUMBER_RE.match(line)) and _line_key(line) not in repeated
+        ]
+        cleaned.append("\n".join(kept))
+    return cleaned
+
+
+def compact_pages(pages):
+    """Normalises extracted pages and drops running headers, footers and page numbers.
+
+    A line counts as a running header/footer when it sits within the first or last few
+    lines of at least half the pages (digits ignored, so "Page 3" matches "Page 4").
+    Page numbers are only looked for within those first and last few lines.
+    """
+    return _normalize("\n".join(_strip_running_lines(pages)))
+
+
+def compact_each(pages):
+    """compact_pages, but returns one compacted string per page."""
+    return [_normalize(page) for page in _strip_running_lines(pages)]
+
+
+def compact_text(text):
+    """compact_pages for text whose page boundaries are unknown.
+
+    Short multi-word lines repeated verbatim five or more times are treated as running
+    headers. Without page edges, a bare number is only taken for a page number when
+    it sits next to such a header; labelled ones ("Page 3", "3 of 10") always are.
+    """
+    lines = text.split("\n")
+    counts = Counter(l.strip() for l in lines if len(l) <= 80 and len(l.split()) >= 2)
+    repeated = {line for line, count in counts.items() if count >= 5}
+    content = [i for i, l in enumerate(lines) if l.strip()]
+    page_numbers = set()
+    for n, i in enumerate(content):
+        if _PAGE_LABEL_RE.match(lines[i]):
+            page_numbers.add(i)
+        elif _PAGE_NUMBER_RE.match(lines[i]):
+            neighbours = content[max(0, n - 1):n] + content[n + 1:n + 2]
+            if any(lines[j].strip() in repeated for j in neighbours):
+                page_numbers.add(i)
+    kept = [l for i, l in enumerate(lines) if i not in page_numbers and l.strip() not in repeated]
+    return _normalize("\n".join(kept))
+
+
+_prepared = OrderedDict()
+_pinned = {}  # key -> [compacted, pins], for documents that are open
+_prepared_lock = threading.Lock()
+
+
+def _document_key(text):
+    # A content digest: unlike hash() it cannot collide by accident between two
+    # documents, and unlike the text itself it does not keep the document alive.
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def pin(text, pages):
+    """Compacts an open document from its pages and keeps the result until unpin().
+
+    Every prepare() of the text returns this page-aware form while it is pinned,
+    including calls that only have the text, so prompts do not depend on which
+    caller compacted the document first.
+    """
+    key = _document_key(text)
+    with _prepared_lock:
+        entry = _pinned.get(key)
+        if entry is None:
+            entry = _pinned[key] = [compact_pages(pages), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def unpin(text):
+    key = _document_key(text)
+    with _prepared_lock:
+        entry = _pinned.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del _pinned[key]
+
+
+def prepare(text, pages=None):
+    """Returns the compacted form of a document, computing it once per document.
+
+    Pass pages when they are known so headers are detected per page; later calls
+    with the same text reuse the cached result. Pinned documents always return
+    their page-aware form.
+    """
+    key = _document_key(text)
+    with _prepared_lock:
+        if key in _pinned:
+            return _pinned[key][0]
+        if key in _prepared:
+            _prepared.move_to_end(key)
+            return _prepared[key]
+    result = compact_pages(pages) if pages is not None else compact_text(text)
+    with _prepared_lock:
+        _prepared[key] = result
+        while len(_prepared) > CACHE_ITEMS:
+            _prepared.popitem(last=False)
+    return result
+
+
+def fit_to_budget(text, budget):
+    """Compacts a document and truncates it to budget tokens for a prompt."""
+    return truncate_to_tokens(prepare(text), budget)
@@ -0,0 +1,145 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from pdf_cache import CACHE_DIR
+
+
+MAX_UPLOAD_BYTES = int(os.environ.get("COGNIFAST_MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+# Estimated peak memory of all uploads being parsed at once; later uploads wait their turn.
+MEMORY_BUDGET_BYTES = int(os.environ.get("COGNIFAST_UPLOAD_MEMORY_BYTES", 1024 * 1024 * 1024))
+# Parsed object trees and page text cost roughly this multiple of the PDF's size.
+PEAK_FACTOR = float(os.environ.get("COGNIFAST_UPLOAD_PEAK_FACTOR", 1.5))
+ADMISSION_TIMEOUT = float(os.environ.get("COGNIFAST_UPLOAD_ADMISSION_TIMEOUT", 300))
+CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the size limit or cannot be admitted in time."""
+
+
+class Spooled:
+    """An upload on disk: its path, size and content hash."""
+
+    def __init__(self, path, size, key, temporary):
+        self.path = path
+        self.size = size
+        self.key = key
+        self._temporary = temporary
+
+    def close(self):
+        if self._temporary:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool(uploaded_file, directory=None, max_bytes=MAX_UPLOAD_BYTES):
+    """Copies an upload to a temporary file in chunks, hashing it on the way.
+
+    Paths are used in place. Never holds more than one chunk of the upload in memory.
+    """
+    digest = hashlib.sha256()
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        size = os.path.getsize(uploaded_file)
+        if size > max_bytes:
+            raise UploadTooLarge(f"{size} bytes exceeds the {max_bytes} byte upload limit")
+        with open(uploaded_file, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return Spooled(os.fspath(uploaded_file), size, digest.hexdigest(), temporary=False)
+
+    directory = directory or os.path.join(CACHE_DIR, "uploads")
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".pdf")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            uploaded_file.seek(0)
+            for chunk in iter(lambda: uploaded_file.read(CHUNK_BYTES), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds the {max_bytes} byte limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return Spooled(path, size, digest.hexdigest(), temporary=True)
+
+
+@contextmanager
+def mapped(path):
+    """Yields a read-only memory map of a file; its pages are paged in on demand."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("The uploaded file is empty.")
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield view
+        finally:
+            view.close()
+
+
+def rss_bytes():
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryGate:
+    """Admits uploads while their combined estimated peak memory fits in a budget.
+
+    A single upload larger than the whole budget is still admitted when nothing
+    else is running, so it is slow rather than impossible.
+    """
+
+    def __init__(self, budget=MEMORY_BUDGET_BYTES):
+        self.budget = budget
+        self.in_flight = 0
+        self.peak = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes, timeout=ADMISSION_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight and self.in_flight + nbytes > self.budget:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise UploadTooLarge("the server is busy processing other large uploads")
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += nbytes
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= nbytes
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"in_flight": self.in_flight, "peak": self.peak, "waiting": self.waiting, "budget": self.budget}
+
+
+default_gate = MemoryGate()
@@ -1,28 +1,325 @@
 from pypdf import PdfReader
-from openai import OpenAI
-import json
-from gtts import gTTS
-import tempfile
+import itertools
+import logging
+import mmap
 import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
+from clients import GROQ_BASE_URL, key_id, registry
+import doc_store
+from pdf_cache import default_cache
+from text_prep import (
+    compact_each, count_tokens, fit_to_budget, prepare, split_by_tokens, split_content_defined, truncate_to_tokens
+)
+from scheduler import BULK, INTERACTIVE, propagate, schedulers
+from llm_cache import make_key, response_cache
+import audio
+import diagrams
+import jobs
+import metrics
+import near_dup
+import precompute
+import question_bank
+import routing
+import schemas
+import uploads
+import workspace
 
-def get_openai_client(api_key):
-    """Initializes and returns the OpenAI client using Groq."""
-    return OpenAI(api_key=api_key, base_url="https://api.groq.com/openai/v1")
 
-def extract_text_from_pdf(uploaded_file):
+logger = logging.getLogger("cognifast.utils")
+
+# Model used when no feature-specific route applies
+MODEL = routing.FAST_MODEL
+# Completion tokens reserved against the rate limit before the real usage is known.
+COMPLETION_TOKEN_ESTIMATE = 800
+# Document tokens each prompt may use, counted after compaction.
+QUIZ_TOKENS = 2000
+FLASHCARDS_TOKENS = 1500
+DIAGRAM_TOKENS = 1500
+SUMMARY_TOKENS = 2000
+TUTOR_TOKENS = 1500
+
+metrics.default_recorder.gauge(
+    "scheduler_queue_depth", "Calls waiting for API quota", lambda: schedulers.stats()["queue_depth"]
+)
+metrics.default_recorder.gauge(
+    "scheduler_wait_avg_seconds", "Average wait for API quota", lambda: schedulers.stats()["wait_avg"]
+)
+metrics.default_recorder.gauge(
+    "document_store_bytes", "Approximate resident bytes of shared documents",
+    lambda: doc_store.default_store.stats()["bytes"]
+)
+metrics.default_recorder.counter(
+    "scheduler_retries", "Retried API calls", lambda: schedulers.stats()["retries"]
+)
+metrics.default_recorder.gauge(
+    "upload_memory_reserved_bytes", "Estimated peak memory reserved by uploads being parsed",
+    lambda: uploads.default_gate.stats()["in_flight"]
+)
+metrics.default_recorder.gauge(
+    "llm_hedge_rate", "Fraction of hedge-eligible calls that sent a duplicate request",
+    lambda: routing.hedger.stats()["hedge_rate"]
+)
+metrics.default_recorder.gauge(
+    "near_dup_hit_rate", "Fraction of new documents matched to an earlier version",
+    lambda: near_dup.default_index().stats()["hit_rate"]
+)
+metrics.default_recorder.gauge(
+    "jobs_running", "Background generation jobs running", lambda: jobs.runner.stats()["running"]
+)
+metrics.default_recorder.gauge(
+    "jobs_queued", "Background generation jobs waiting on a per-user limit", lambda: jobs.runner.stats()["queued"]
+)
+
+
+def get_openai_client(api_key, base_url=GROQ_BASE_URL):
+    """Returns the process-wide OpenAI client for this API key, using Groq."""
+    return registry.get(api_key, base_url)
+
+_worker_reader = None
+
+def _init_page_worker(path):
+    """Maps the spooled PDF and parses it once per worker process."""
+    global _worker_reader
+    f = open(path, "rb")  # Kept open, with its map, for the worker's lifetime
+    _worker_reader = PdfReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def _extract_page_range(start, stop):
+    return [_worker_reader.pages[i].extract_text() for i in range(start, stop)]
+
+def iter_pdf_pages(uploaded_file, workers=None, pages_per_task=16, cache=default_cache, progress=None, gate=None):
+    """Yields page text in order, splitting page ranges across a process pool.
+
+    The upload is spooled to disk and parsed through a memory map, so its bytes are
+    never held in memory whole, and parsing waits for room in the upload memory gate.
+    ``progress`` is called as ``progress(done, total)`` after each page.
+    """
+    gate = gate or uploads.default_gate
+    with uploads.spool(uploaded_file) as spooled, \
+            metrics.track("upload", "pdf", bytes=spooled.size) as event:
+        pages = cache.get(spooled.key) if cache is not None else None
+        if pages is not None:
+            event["cache_hit"] = True
+            event["pages"] = len(pages)
+            for i, page in enumerate(pages):
+                if progress: progress(i + 1, len(pages))
+                yield page
+            return
+
+        waited = time.perf_counter()
+        with gate.reserve(int(spooled.size * uploads.PEAK_FACTOR)), uploads.mapped(spooled.path) as view:
+            event["admission_wait"] = time.perf_counter() - waited
+            baseline = peak = uploads.rss_bytes()
+            reader = PdfReader(view)
+            total = event["pages"] = len(reader.pages)
+            workers = workers or os.cpu_count() or 1
+            pages = []
+            pool = None
+
+            if workers == 1 or total <= pages_per_task:
+                page_texts = (page.extract_text() for page in reader.pages)
+            else:
+                ranges = [(i, min(i + pages_per_task, total)) for i in range(0, total, pages_per_task)]
+                pool = ProcessPoolExecutor(
+                    max_workers=min(workers, len(ranges)),
+                    initializer=_init_page_worker,
+                    initargs=(spooled.path,),
+                )
+                futures = [pool.submit(_extract_page_range, start, stop) for start, stop in ranges]
+                page_texts = (text for future in futures for text in future.result())
+
+            try:
+                for text in page_texts:
+                    pages.append(text)
+                    if baseline is not None:
+                        peak = max(peak, uploads.rss_bytes() or peak)
+                    if progress: progress(len(pages), total)
+                    yield text
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+                if baseline is not None:
+                    event["rss_growth"] = peak - baseline
+
+        if cache is not None:
+            cache.put(spooled.key, pages)
+
+def extract_pages_from_pdf(uploaded_file, cache=default_cache, workers=1, progress=None):
+    """Extracts per-page text, skipping parsing when the same bytes were seen before."""
+    return list(iter_pdf_pages(uploaded_file, workers=workers, cache=cache, progress=progress))
+
+def open_document(pages):
+    """Returns a handle to the shared, reference-counted copy of a document's pages.
+
+    A new document that is a revision of an earlier one inherits its question bank.
+    """
+    document = doc_store.default_store.add(pages)
+    try:
+        reuse_near_duplicate(document)
+    except Exception as e:
+        logger.warning("near-duplicate lookup failed: %s", e)
+    return document
+
+def reuse_near_duplicate(document, index=None):
+    """Seeds a new document's question bank from its closest earlier version.
+
+    Only questions on unchanged pages are kept, and the changed pages are the first
+    ones the next fill generates questions for. Returns the match, or None.
+    """
+    index = index or near_dup.default_index()
+    with metrics.track("near_dup", "lookup", pages=len(document.pages)) as event:
+        match = index.lookup(document.key, near_dup.fingerprint(document.pages))
+        event["hit"] = match is not None
+        if match is None:
+            return None
+        event["similarity"] = match.similarity
+        event["changed_pages"] = len(match.changed_pages)
+        bank = question_bank.get_bank(document.key)
+        if not len(bank):
+            previous = question_bank.get_bank(match.key).questions()
+            event["reused_questions"] = bank.seed(previous, match.page_map, match.changed_pages)
+    return match
+
+def open_workspace(api_key):
+    """Returns the persistent workspace of the user behind an API key."""
+    return workspace.default_workspace().for_user(workspace.user_id(api_key))
+
+def extract_text_from_pdf(uploaded_file, cache=default_cache, workers=1, progress=None):
     """Extracts text from an uploaded PDF file."""
     try:
-        reader = PdfReader(uploaded_file)
-        text = "".join([page.extract_text() for page in reader.pages])
-        return text
+        return "".join(iter_pdf_pages(uploaded_file, workers=workers, cache=cache, progress=progress))
     except Exception as e:
         raise Exception(f"Error reading PDF: {e}")
 
-def generate_quiz_content(client, text, num_q, level):
-    """Generates quiz questions using the LLM."""
-    prompt = f"""
-    Create a {num_q}-question multiple choice quiz based on this text.
+def _estimate_request_tokens(messages):
+    return sum(count_tokens(m["content"]) for m in messages) + COMPLETION_TOKEN_ESTIMATE
+
+def _scheduler_for(client):
+    return schedulers.get(key_id(client.api_key))
+
+def _admission(client, messages, priority):
+    """Returns the hedger's admit(blocking) for a call: takes its quota from the key's scheduler."""
+    scheduler = _scheduler_for(client)
+    estimated = _estimate_request_tokens(messages)
+
+    def admit(blocking):
+        if blocking:
+            scheduler.acquire(estimated, priority)
+            return True
+        # A hedge is only worth sending if it does not have to queue for quota
+        return scheduler.try_acquire(estimated, priority)
+
+    return admit
+
+def _create(client, messages, priority=BULK, model=MODEL, cancelled=None, admitted=False, **params):
+    """Sends a completion request through its API key's rate limiter and retry scheduler.
+
+    A request whose ``cancelled`` event is set while it waits for quota is never sent.
+    With admitted, its quota was already taken by the hedger's admit.
+    """
+    scheduler = _scheduler_for(client)
+    estimated = _estimate_request_tokens(messages)
+
+    def send():
+        if cancelled is not None and cancelled.is_set():
+            raise routing.Cancelled(model)
+        return client.chat.completions.create(model=model, messages=messages, **params)
+
+    response = scheduler.call(send, estimated, priority, acquired=admitted)
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None):
+        scheduler.settle(estimated, usage.total_tokens)
+    return response
+
+def _record_usage(event, usage):
+    if usage is not None:
+        event["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+        event["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+def _prompt_chars(messages):
+    return sum(len(m["content"]) for m in messages)
+
+def _complete(client, messages, use_cache=True, priority=BULK, feature="other", valid=None, **params):
+    """Returns the completion text for messages, served from the response cache when possible.
+
+    When ``valid`` is given, only responses it accepts are cached, so a malformed
+    answer is asked for again instead of being replayed.
+    """
+    with metrics.track(feature, "llm", prompt_chars=_prompt_chars(messages)) as event:
+        model = routing.choose_model(feature, sum(count_tokens(m["content"]) for m in messages))
+        key = make_key(model, messages, params) if use_cache and response_cache is not None else None
+        if key is not None:
+            cached = response_cache.get(key)
+            if cached is not None:
+                event["cache_hit"] = True
+                return cached
+
+        response = routing.hedger.call(
+            feature, model,
+            propagate(lambda cancelled, admitted: _create(client, messages, priority, model, cancelled, admitted, **params)),
+            event=event, admit=_admission(client, messages, priority),
+            valid=(lambda r: valid(r.choices[0].message.content)) if valid is not None else None,
+        )
+        _record_usage(event, getattr(response, "usage", None))
+        content = response.choices[0].message.content
+        if key is not None and (valid is None or valid(content)):
+            response_cache.set(key, content)
+        return content
+
+# Follow-up requests for items that were missing or could not be repaired.
+REPAIR_ROUNDS = 1
+FLASHCARD_COUNT = 6
+
+def _generate_items(client, build_prompt, count, keys, validate, identity, feature, use_cache=True, existing=(),
+                    check=None):
+    """Requests count items, repairs what it can and re-requests only what is still missing.
+
+    check, if given, is called before each request and may raise to stop early.
+    """
+    items, seen = [], set()
+    missing = count
+    for attempt in range(1 + REPAIR_ROUNDS):
+        if check is not None:
+            check()
+        raw = _complete(
+            client,
+            [{"role": "user", "content": build_prompt(missing, list(existing) + [identity(i) for i in items])}],
+            # Repairs always go to the model: they follow a response that fell short
+            use_cache=use_cache and attempt == 0,
+            feature=feature,
+            valid=lambda content: bool(schemas.parse_items(content, keys, validate)[0]),
+            response_format={"type": "json_object"}
+        )
+        valid, _ = schemas.parse_items(raw, keys, validate)
+        for item in valid:
+            key = identity(item).casefold()
+            if key not in seen:
+                seen.add(key)
+                items.append(item)
+        missing = count - len(items)
+        if missing <= 0:
+            break
+    if not items:
+        raise ValueError(f"The model did not return any usable {feature} items.")
+    return items[:count]
+
+AVOID_LIST_ITEMS = 20
+
+def _avoid_clause(existing):
+    if not existing:
+        return ""
+    listed = "\n".join(f"- {e}" for e in existing[-AVOID_LIST_ITEMS:])
+    return f"\n    Do not repeat any of these:\n{listed}\n"
+
+def generate_quiz_content(client, text, num_q, level, use_cache=True, avoid=(), check=None):
+    """Generates quiz questions using the LLM, none of them repeating the questions in avoid."""
+    context = fit_to_budget(text, QUIZ_TOKENS)
+
+    def build_prompt(n, existing):
+        return f"""
+    Create a {n}-question multiple choice quiz based on this text.
     Difficulty: {level}.
     Return ONLY a valid JSON array with this structure:
     [
@@ -32,78 +329,489 @@ def generate_quiz_content(client, text, num_q, level):
             "answer": "Option B"
         }}
     ]
-    
-    Text: {text[:6000]}
+    {_avoid_clause(existing)}
+    Text: {context}
     """
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"}
+
+    return _generate_items(
+        client, build_prompt, num_q, schemas.QUIZ_KEYS, schemas.validate_quiz_item,
+        lambda item: item["question"], "quiz", use_cache, avoid, check
     )
-    data = json.loads(response.choices[0].message.content)
-    
-    if "quiz" in data: return data["quiz"]
-    elif "questions" in data: return data["questions"]
-    else: return data[list(data.keys())[0]]
 
-def generate_flashcards_content(client, text):
+BANK_CHUNK_TOKENS = 1500
+BANK_QUESTIONS_PER_CHUNK = 6
+# Chunks covered by the first fill of a bank, and by each later top-up.
+BANK_BUILD_CHUNKS = 8
+BANK_REFILL_CHUNKS = 4
+
+def _bank_chunks(document):
+    """Groups the compacted pages into (first_page, last_page, text) chunks with page markers."""
+    chunks, parts, first, last, used = [], [], None, None, 0
+    for number, page in enumerate(compact_each(document.pages), 1):
+        for piece in split_by_tokens(page, BANK_CHUNK_TOKENS):
+            cost = count_tokens(piece)
+            if parts and used + cost > BANK_CHUNK_TOKENS:
+                chunks.append((first, last, "\n\n".join(parts)))
+                parts, first, used = [], None, 0
+            parts.append(f"[Page {number}]\n{piece}")
+            first = first or number
+            last = number
+            used += cost
+    if parts:
+        chunks.append((first, last, "\n\n".join(parts)))
+    return chunks
+
+def _bank_questions(client, chunk, existing, use_cache=True):
+    """Generates difficulty- and page-tagged questions for one chunk of the document."""
+    first, last, context = chunk
+
+    def build_prompt(n, avoid):
+        return f"""
+    Create a {n}-question multiple choice quiz based on this text.
+    Mix Easy, Medium and Hard questions. The text is split by [Page N] markers;
+    give the page each question is answered on.
+    Return ONLY a valid JSON object with this structure:
+    {{"questions": [
+        {{
+            "question": "Question text?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "answer": "Option B",
+            "difficulty": "Medium",
+            "page": {first}
+        }}
+    ]}}
+    {_avoid_clause(avoid)}
+    Text: {context}
+    """
+
+    items = _generate_items(
+        client, build_prompt, BANK_QUESTIONS_PER_CHUNK, schemas.QUIZ_KEYS, schemas.validate_quiz_item,
+        lambda item: item["question"], "question_bank", use_cache, existing
+    )
+    for item in items:
+        if not first <= item.get("page", 0) <= last:
+            item["page"] = first
+    return items
+
+def fill_question_bank(client, document, chunks=BANK_BUILD_CHUNKS, max_workers=4):
+    """Generates questions for the next chunks of the document in parallel and banks them.
+
+    Chunks are taken round-robin across the whole document, so repeated fills
+    widen coverage before revisiting a passage. Returns the number of new questions.
+    """
+    bank = question_bank.get_bank(document.key)
+    all_chunks = _bank_chunks(document)
+    if not all_chunks:
+        return 0
+    # Pages that changed since a reused earlier version come first
+    indices = bank.next_stale([(first, last) for first, last, _ in all_chunks], chunks)
+    if len(indices) < chunks:
+        indices += [i for i in bank.next_chunks(chunks - len(indices), len(all_chunks)) if i not in indices]
+    selected = [all_chunks[i] for i in indices]
+    existing = [q["question"] for q in bank.questions()]
+
+    added, errors = 0, []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(propagate(_bank_questions), client, chunk, existing) for chunk in selected]
+        for future in as_completed(futures):
+            try:
+                added += bank.add(future.result())
+            except Exception as e:
+                errors.append(e)
+    if errors and len(errors) == len(futures):
+        raise errors[0]
+    bank.save()  # Persists the advanced cursor even when nothing new was added
+    return added
+
+def quiz_in_bank(document, num_q, level, seen):
+    """Whether draw_quiz can serve this quiz from the bank, without an LLM call."""
+    return question_bank.get_bank(document.key).available(level, exclude=seen) >= num_q
+
+def draw_quiz(client, document, num_q, level, seen, check=None):
+    """Serves a quiz from the document's question bank, falling back to a direct generation.
+
+    Questions handed out are added to seen. Whenever the unserved stock runs low a
+    background top-up starts, so later quizzes are served without an LLM call.
+    check, if given, is called between steps and may raise to stop early.
+    """
+    bank = question_bank.get_bank(document.key)
+    questions = bank.draw(num_q, level, exclude=seen)
+    if len(questions) < num_q:
+        if check is not None:
+            check()
+        # The bank is still being built, or this difficulty has run dry for this session.
+        # Never cached: a replayed quiz would repeat questions this session has answered.
+        served = [q["question"] for q in bank.questions() if q["id"] in seen]
+        questions = generate_quiz_content(
+            client, document.text, num_q, level, use_cache=False, avoid=served, check=check
+        )
+        bank.add([dict(q, difficulty=q.get("difficulty", level)) for q in questions])
+        questions = [dict(q, id=question_bank.question_id(q["question"])) for q in questions]
+
+    seen.update(q["id"] for q in questions)
+    if bank.available(level, exclude=seen) < question_bank.LOW_WATER:
+        chunks = BANK_BUILD_CHUNKS if len(bank) < BANK_BUILD_CHUNKS else BANK_REFILL_CHUNKS
+        bank.refill_async(lambda: fill_question_bank(client, document, chunks))
+    return questions
+
+def generate_flashcards_content(client, text, use_cache=True):
     """Generates flashcards content using the LLM."""
-    prompt = f"""
-    Extract 6 key concepts and definitions from the text. 
-    Return JSON: [{{"concept": "Term", "definition": "Meaning"}}]
-    Text: {text[:6000]}
-    """
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"}
+    context = fit_to_budget(text, FLASHCARDS_TOKENS)
+
+    def build_prompt(n, existing):
+        return f"""
+    Extract {n} key concepts and definitions from the text. 
+    Return JSON: [{{"concept": "Term", "definition": "Meaning"}}]{_avoid_clause(existing)}
+    Text: {context}
+    """
+
+    return _generate_items(
+        client, build_prompt, FLASHCARD_COUNT, schemas.FLASHCARD_KEYS, schemas.validate_flashcard,
+        lambda item: item["concept"], "flashcards", use_cache
     )
-    data = json.loads(response.choices[0].message.content)
-    
-    if isinstance(data, list): return data
-    elif "flashcards" in data: return data["flashcards"]
-    elif "concepts" in data: return data["concepts"]
-    else:
-        first_key = list(data.keys())[0]
-        if isinstance(data[first_key], list): return data[first_key]
-        return []
-
-def generate_diagram_code(client, text):
-    """Generates Graphviz DOT code for a diagram."""
+
+def _diagram_prompt(text, error=None):
     prompt = f"""
     Create a Graphviz DOT code to visualize the key concepts in this text.
     Keep it simple, hierarchical, and use clean labels.
     Return ONLY the code inside a code block. Do not include markdown backticks.
-    Text: {text[:6000]}
+    Text: {fit_to_budget(text, DIAGRAM_TOKENS)}
     """
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    dot_code = response.choices[0].message.content.replace("```dot", "").replace("```", "").strip()
-    return dot_code
+    if error:
+        prompt += f"""
+    Your previous answer was not valid DOT ({error}). Return corrected, complete DOT code.
+    """
+    return prompt
+
+def _is_valid_dot(content):
+    try:
+        diagrams.validate_dot(content)
+    except diagrams.DotError:
+        return False
+    return True
+
+def generate_diagram_code(client, text, use_cache=True):
+    """Generates Graphviz DOT code for a diagram, validated and pruned on the server.
+
+    Output that does not parse is re-requested once with the parse error.
+    """
+    error = None
+    for attempt in range(1 + REPAIR_ROUNDS):
+        content = _complete(
+            client, [{"role": "user", "content": _diagram_prompt(text, error)}],
+            use_cache=use_cache and attempt == 0, feature="diagram", valid=_is_valid_dot
+        )
+        try:
+            with metrics.track("diagram", "validate") as event:
+                dot_code, info = diagrams.validate_dot(content)
+                event.update(info)
+            return dot_code
+        except diagrams.DotError as e:
+            error = str(e)
+    raise ValueError(f"The model did not return a valid diagram: {error}")
+
+def render_diagram(dot_code):
+    """Returns the cached server-side SVG layout of a diagram, or None without Graphviz."""
+    try:
+        return diagrams.render_svg(dot_code)
+    except (diagrams.DotError, OSError, subprocess.TimeoutExpired):
+        return None
+
+def _open_stream(client, messages, priority, model, cancelled, admitted):
+    """Starts a streamed completion and waits for its first chunk."""
+    stream = _create(client, messages, priority, model, cancelled, admitted, stream=True)
+    try:
+        first = next(iter(stream), None)
+    except BaseException:
+        stream.close()
+        raise
+    if cancelled.is_set():
+        stream.close()  # Lost the race while waiting; stop the generation
+    return stream, first
+
+def _stream_completion(client, messages, stats=None, priority=BULK, feature="other"):
+    """Yields content deltas as they arrive, recording time to first token in ``stats``.
+
+    A stream that is slow to start is raced against a duplicate; the other is closed.
+    """
+    with metrics.track(feature, "llm_stream", prompt_chars=_prompt_chars(messages)) as event:
+        started = time.perf_counter()
+        model = routing.choose_model(feature, sum(count_tokens(m["content"]) for m in messages))
+        stream, first = routing.hedger.call(
+            feature, model,
+            lambda cancelled, admitted: _open_stream(client, messages, priority, model, cancelled, admitted),
+            discard=lambda result: result[0].close(),
+            event=event, admit=_admission(client, messages, priority),
+        )
+        deltas = 0
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            _record_usage(event, getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if "ttft" not in event:
+                    event["ttft"] = time.perf_counter() - started
+                    if stats is not None:
+                        stats["ttft"] = event["ttft"]
+                deltas += 1
+                yield delta
+        if event.get("completion_tokens") is None:
+            # The API did not report usage; each streamed delta is roughly one token.
+            event["completion_tokens"] = deltas
+        if stats is not None:
+            stats["total"] = time.perf_counter() - started
+
+def _summary_messages(text, minutes=2):
+    summary_prompt = f"Summarize this text into a concise, engaging {minutes}-minute study script suitable for listening. Be sure to not include timestamps, or any type of description of music or who is speaking such as [host]. Text: {fit_to_budget(text, SUMMARY_TOKENS)}"
+    return [{"role": "user", "content": summary_prompt}]
+
+def _chunk_summary_messages(chunk):
+    prompt = f"Summarize the key ideas, definitions and examples in this section of a study document as concise bullet points. Text: {chunk}"
+    return [{"role": "user", "content": prompt}]
+
+def _reduce_messages(notes, minutes=2):
+    prompt = f"These are section-by-section notes covering a whole study document, in order. Turn them into a concise, engaging {minutes}-minute study script suitable for listening that covers the entire document. Be sure to not include timestamps, or any type of description of music or who is speaking such as [host]. Notes: {notes}"
+    return [{"role": "user", "content": prompt}]
+
+# Target map chunk size; content-defined chunks stay under twice this, well below a key's per-minute tokens.
+MAP_CHUNK_TOKENS = 1500
+REDUCE_MAX_TOKENS = 3000
+
+def _summarize_chunk(client, chunk, use_cache=True):
+    if not use_cache:
+        return _complete(client, _chunk_summary_messages(chunk), use_cache=False, feature="audio")
+    index = near_dup.default_index()
+    key = near_dup.chunk_key(chunk)
+    summary = index.summary(key)
+    if summary is None:
+        summary = _complete(client, _chunk_summary_messages(chunk), feature="audio")
+        index.set_summary(key, summary)
+    return summary
+
+def summarize_chunks(client, text, max_workers=4, use_cache=True):
+    """Map phase: summarises every chunk of the document with bounded concurrency.
+
+    Chunks have a fixed target size, so no map request outgrows the API's token
+    limits; a longer document makes more map calls and _reduce_notes folds their
+    summaries in a tree. Chunk boundaries are content-defined and summaries are
+    kept by chunk, so a revised document only re-summarises the chunks that changed.
+    """
+    chunks = split_content_defined(prepare(text), MAP_CHUNK_TOKENS)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(propagate(lambda chunk: _summarize_chunk(client, chunk, use_cache)), chunks))
+
+def _reduce_notes(client, partials, max_workers=4, use_cache=True):
+    """Collapses partial summaries until they fit into a single reduce prompt."""
+    notes = "\n\n".join(partials)
+    while count_tokens(notes) > REDUCE_MAX_TOKENS and len(partials) > 1:
+        groups, group, group_tokens = [], [], 0
+        for partial in partials:
+            tokens = count_tokens(partial)
+            if group and group_tokens + tokens > REDUCE_MAX_TOKENS:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(partial)
+            group_tokens += tokens
+        groups.append(group)
+        if len(groups) == len(partials):
+            break
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            partials = list(pool.map(
+                propagate(lambda g: _complete(
+                    client, _chunk_summary_messages("\n\n".join(g)), use_cache=use_cache, feature="audio"
+                )),
+                groups
+            ))
+        notes = "\n\n".join(partials)
+    return truncate_to_tokens(notes, REDUCE_MAX_TOKENS)
+
+def _audio_script_messages(client, text, mode, minutes, use_cache=True, max_workers=4):
+    if mode == "map_reduce":
+        partials = summarize_chunks(client, text, max_workers=max_workers, use_cache=use_cache)
+        notes = _reduce_notes(client, partials, max_workers=max_workers, use_cache=use_cache)
+        return _reduce_messages(notes, minutes)
+    return _summary_messages(text, minutes)
+
+def new_audio_owner():
+    """Returns a handle whose audio files are deleted when it is released or collected."""
+    return audio.default_store.new_owner()
 
-def generate_audio_summary(client, text):
+def synthesize_audio(summary_text, owner=None, on_segment=None, backend=None, store=None):
+    """Converts a study script to speech and returns the MP3 file path.
+
+    Sentence segments are synthesised concurrently; ``on_segment(index, data)`` is called
+    as each one becomes available in order, so playback can start before the rest is done.
+    The file lives in the audio store and is removed when ``owner`` is released.
+    """
+    backend = backend or audio.default_backend
+    store = store or audio.default_store
+    parts = []
+    with metrics.track("audio", "tts", chars=len(summary_text)) as event:
+        started = time.perf_counter()
+        for i, data in enumerate(audio.synthesize_segments(summary_text, backend)):
+            if i == 0:
+                # Time until the first segment is playable
+                event["ttft"] = time.perf_counter() - started
+            parts.append(data)
+            if on_segment: on_segment(i, data)
+        event["segments"] = len(parts)
+    return store.save(b"".join(parts), owner=owner.id if owner is not None else None)
+
+def generate_audio_script(client, text, use_cache=True, mode="single", minutes=2, max_workers=4):
+    """Writes the audio summary script without streaming it.
+
+    ``mode="map_reduce"`` summarises the whole document instead of its first pages,
+    with up to max_workers map and reduce calls at once.
+    """
+    messages = _audio_script_messages(client, text, mode, minutes, use_cache, max_workers)
+    return _complete(client, messages, use_cache=use_cache, feature="audio")
+
+def generate_audio_summary(client, text, use_cache=True, mode="single", minutes=2, owner=None):
     """Generates an audio summary and returns the file path and script."""
-    summary_prompt = f"Summarize this text into a concise, engaging 2-minute study script suitable for listening. Be sure to not include timestamps, or any type of description of music or who is speaking such as [host]. Text: {text[:6000]}"
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": summary_prompt}]
+    summary_text = generate_audio_script(client, text, use_cache, mode, minutes)
+    return synthesize_audio(summary_text, owner=owner), summary_text
+
+def stream_audio_script(client, text, stats=None, mode="single", minutes=2):
+    """Streams the audio summary script token by token."""
+    started = time.perf_counter()
+    messages = _audio_script_messages(client, text, mode, minutes)
+    map_time = time.perf_counter() - started
+    for delta in _stream_completion(client, messages, stats, feature="audio"):
+        yield delta
+    if stats is not None:
+        # Report latency from the user's click, including the map phase.
+        stats["map"] = map_time
+        if "ttft" in stats:
+            stats["ttft"] += map_time
+        stats["total"] = time.perf_counter() - started
+
+def _chat_messages(text, input_text, index, workspace=None):
+    context = ""
+    if workspace is not None:
+        context = workspace.context_for(input_text, token_budget=TUTOR_TOKENS)
+    if not context and index is not None:
+        context = index.context_for(input_text, token_budget=TUTOR_TOKENS)
+    elif not context:
+        context = fit_to_budget(text, TUTOR_TOKENS)
+    return [
+        {"role": "system", "content": f"You are a helpful tutor. Context: {context}"},
+        {"role": "user", "content": input_text}
+    ]
+
+def get_chat_response(client, text, input_text, index=None, use_cache=False, workspace=None):
+    """Generates a chat response from the AI tutor.
+
+    When a retrieval index is given, only the chunks relevant to the question are sent.
+    With a workspace, passages are retrieved across all of the user's documents instead,
+    falling back to the index when none of them match.
+    """
+    return _complete(
+        client, _chat_messages(text, input_text, index, workspace),
+        use_cache=use_cache, priority=INTERACTIVE, feature="tutor"
     )
-    summary_text = response.choices[0].message.content
-    
-    tts = gTTS(text=summary_text, lang='en', tld='co.uk')
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-        tts.save(fp.name)
-        return fp.name, summary_text
-
-def get_chat_response(client, text, input_text):
-    """Generates a chat response from the AI tutor."""
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": f"You are a helpful tutor. Context: {text[:6000]}"},
-            {"role": "user", "content": input_text}
-        ]
+
+def stream_chat_response(client, text, input_text, index=None, stats=None, workspace=None):
+    """Streams the AI tutor's reply token by token."""
+    return _stream_completion(
+        client, _chat_messages(text, input_text, index, workspace), stats, INTERACTIVE, feature="tutor"
     )
-    return response.choices[0].message.content
\ No newline at end of file
+
+def iter_study_pack(client, text, num_q=5, level="Medium", max_workers=4, owner=None):
+    """Runs every study-pack generator concurrently.
+
+    Yields ``(name, result, error)`` as each call finishes, so wall time tracks the
+    slowest call rather than the sum of all of them.
+    """
+    tasks = {
+        "quiz": lambda: generate_quiz_content(client, text, num_q, level),
+        "flashcards": lambda: generate_flashcards_content(client, text),
+        "diagram": lambda: generate_diagram_code(client, text),
+        "audio": lambda: generate_audio_summary(client, text, mode="map_reduce", owner=owner),
+    }
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fn): name for name, fn in tasks.items()}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+def start_precompute(client, document, minutes=2, artefacts=None):
+    """Starts warming the artefacts a user is likely to open first for a new document.
+
+    Its calls run at speculative priority, so they never use up the quota the
+    user's own requests need and stop once the Precompute is cancelled. The
+    returned Precompute is polled by the tools page and cancelled with the document.
+    """
+    def quiz():
+        bank = question_bank.get_bank(document.key)
+        if len(bank) >= BANK_BUILD_CHUNKS:
+            return len(bank)
+        # Shares the bank's refill slot, so a quiz drawn meanwhile does not start a second fill
+        return bank.refill_async(propagate(lambda: fill_question_bank(client, document))).result()
+
+    tasks = {
+        "index": lambda: document.index,
+        "flashcards": lambda: generate_flashcards_content(client, document.text),
+        "quiz": quiz,
+        "audio_script": lambda: (minutes, generate_audio_script(client, document.text, mode="map_reduce", minutes=minutes)),
+    }
+    wanted = precompute.ARTEFACTS if artefacts is None else artefacts
+    return precompute.Precompute({name: tasks[name] for name in wanted if name in tasks})
+
+def start_quiz_job(client, document, num_q, level, seen, user, session):
+    """Draws a quiz on the background job runner and returns the job.
+
+    Meant for quizzes the bank cannot serve yet (see quiz_in_bank), which need an
+    LLM call; the job stops at its next step when cancelled.
+
+    A second request from the same session with the same settings while the first
+    is running returns the same job, so repeated clicks do not generate twice.
+    Other sessions get their own job, drawn against their own seen set.
+    """
+    def run(job):
+        job.progress(0.1, "Writing questions...")
+        return draw_quiz(client, document, num_q, level, seen, check=job.check)
+
+    return jobs.runner.submit(user, "quiz", (document.key, num_q, level, session), run)
+
+def start_audio_job(client, document, minutes, owner, user, script=None):
+    """Writes (unless a script is given) and records the audio summary as a background job.
+
+    The script streams into ``job.partial`` while it is written. The job publishes
+    ``ttft``, the seconds until the script started streaming, and ``preview``, the
+    path of the first recorded segment, so playback can start before the rest is
+    recorded. The result is ``[audio_path, script]``. Files belong to owner, which
+    is part of the job's key, so sessions never share a recording.
+    """
+    def run(job):
+        started = time.perf_counter()
+        text = script
+        if text is None:
+            job.progress(0.05, "Writing script...")
+            for delta in stream_audio_script(client, document.text, mode="map_reduce", minutes=minutes):
+                if not job.partial:
+                    job.publish("ttft", time.perf_counter() - started)
+                job.append(delta)
+            text = job.partial
+        else:
+            job.publish("ttft", 0.0)
+            job.append(text)
+        job.progress(0.6, "Recording...")
+        sentences = max(1, len(audio.split_sentences(text)))
+
+        def on_segment(index, data):
+            if index == 0:
+                job.publish("preview", audio.default_store.save(data, owner=owner.id))
+            job.progress(0.6 + 0.4 * (index + 1) / sentences, f"Recording part {index + 1} of {sentences}...")
+
+        return [synthesize_audio(text, owner=owner, on_segment=on_segment), text]
+
+    return jobs.runner.submit(user, "audio", (document.key, minutes, owner.id), run)
+
+def get_job(job_id):
+    return jobs.runner.get(job_id)
+
+def cancel_job(job_id):
+    return jobs.runner.cancel(job_id)
@@ -0,0 +1,246 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from pdf_cache import CACHE_DIR
+from retrieval import chunk_text, tokenize
+from text_prep import compact_each, count_tokens
+
+
+DB_PATH = os.environ.get("COGNIFAST_WORKSPACE_DB", os.path.join(CACHE_DIR, "workspace.sqlite3"))
+PASSAGE_CHARS = 1200
+PASSAGE_OVERLAP = 200
+# Longer questions are cut to this many distinct terms; each one widens the match.
+MAX_QUERY_TERMS = 16
+POOL_SIZE = 8
+
+# Matching these would touch nearly every passage without changing the ranking much.
+_STOPWORDS = frozenset(
+    "a about an and are as at be but by can do does for from how i in is it its me my "
+    "of on or so than that the their them then there these they this to was what when "
+    "where which who why will with you your".split()
+)
+
+
+def user_id(api_key):
+    """Returns the workspace id for an API key; the key itself is never stored."""
+    return hashlib.sha256(f"cognifast-workspace:{api_key}".encode("utf-8")).hexdigest()[:32]
+
+
+def document_key(pages):
+    """Same content address as the in-memory document store."""
+    return hashlib.sha256("".join(pages).encode("utf-8")).hexdigest()
+
+
+def match_query(text):
+    """Turns a free-text question into an FTS5 query that matches any of its terms."""
+    terms = []
+    for term in tokenize(text):
+        if term not in _STOPWORDS and term not in terms:
+            terms.append(term)
+    return " OR ".join(f'"{t}"' for t in terms[:MAX_QUERY_TERMS])
+
+
+class Workspace:
+    """Every user's documents in one SQLite file, with an FTS5 index of their passages.
+
+    A document is stored and indexed once however many users add it; users only
+    hold a named reference to it. Pages are kept verbatim so a document can be
+    reopened without the PDF, and passages are indexed from the compacted pages.
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " key TEXT PRIMARY KEY, pages INTEGER NOT NULL, chars INTEGER NOT NULL, created REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " doc_key TEXT NOT NULL, page_no INTEGER NOT NULL, text TEXT NOT NULL,"
+                " PRIMARY KEY (doc_key, page_no)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS members ("
+                " user TEXT NOT NULL, doc_key TEXT NOT NULL, name TEXT NOT NULL,"
+                " added REAL NOT NULL, opened REAL NOT NULL,"
+                " PRIMARY KEY (user, doc_key)) WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS members_doc ON members(doc_key);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                " text, doc_key UNINDEXED, page_no UNINDEXED, tokenize='porter unicode61');"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrows a pooled connection, so searches reuse a warm page cache."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def add(self, user, name, pages):
+        """Adds a document to user's workspace, indexing it unless it is already stored."""
+        key = document_key(pages)
+        now = time.time()
+        with self._write_lock, self._connection() as conn:
+            known = conn.execute("SELECT 1 FROM documents WHERE key = ?", (key,)).fetchone()
+            if known is None:
+                with metrics.track("workspace", "index", pages=len(pages)) as event:
+                    passages = [
+                        (passage, key, page_no)
+                        for page_no, page in enumerate(compact_each(pages), start=1)
+                        for passage in chunk_text(page, PASSAGE_CHARS, PASSAGE_OVERLAP)
+                    ]
+                    conn.execute(
+                        "INSERT INTO documents VALUES (?, ?, ?, ?)",
+                        (key, len(pages), sum(len(p) for p in pages), now),
+                    )
+                    conn.executemany(
+                        "INSERT INTO pages VALUES (?, ?, ?)",
+                        ((key, page_no, page) for page_no, page in enumerate(pages, start=1)),
+                    )
+                    conn.executemany("INSERT INTO passages (text, doc_key, page_no) VALUES (?, ?, ?)", passages)
+                    event["passages"] = len(passages)
+            conn.execute(
+                "INSERT INTO members VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (user, doc_key) DO UPDATE SET name = excluded.name, opened = excluded.opened",
+                (user, key, name, now, now),
+            )
+        return key
+
+    def documents(self, user):
+        """Returns user's documents, most recently opened first."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT m.doc_key, m.name, d.pages, m.added, m.opened"
+                " FROM members m JOIN documents d ON d.key = m.doc_key"
+                " WHERE m.user = ? ORDER BY m.opened DESC",
+                (user,),
+            ).fetchall()
+        return [
+            {"key": key, "name": name, "pages": pages, "added": added, "opened": opened}
+            for key, name, pages, added, opened in rows
+        ]
+
+    def pages(self, user, key):
+        """Returns the stored pages of one of user's documents and marks it as opened."""
+        with self._connection() as conn:
+            updated = conn.execute(
+                "UPDATE members SET opened = ? WHERE user = ? AND doc_key = ?", (time.time(), user, key)
+            ).rowcount
+            if not updated:
+                raise KeyError(key)
+            rows = conn.execute("SELECT text FROM pages WHERE doc_key = ? ORDER BY page_no", (key,)).fetchall()
+        return [text for (text,) in rows]
+
+    def remove(self, user, key):
+        """Removes a document from user's workspace, and from disk once nobody holds it."""
+        with self._write_lock, self._connection() as conn:
+            conn.execute("DELETE FROM members WHERE user = ? AND doc_key = ?", (user, key))
+            if conn.execute("SELECT 1 FROM members WHERE doc_key = ? LIMIT 1", (key,)).fetchone() is None:
+                conn.execute("DELETE FROM passages WHERE doc_key = ?", (key,))
+                conn.execute("DELETE FROM pages WHERE doc_key = ?", (key,))
+                conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+
+    def search(self, user, query, k=8):
+        """Returns up to k passages from user's documents ranked by BM25, best first."""
+        match = match_query(query)
+        if not match:
+            return []
+        with metrics.track("workspace", "search", terms=match.count('"') // 2) as event:
+            with self._connection() as conn:
+                # Other users' passages are dropped as the match reads them, before ranking
+                rows = conn.execute(
+                    "SELECT p.doc_key, m.name, p.page_no, p.text, p.score FROM ("
+                    " SELECT doc_key, page_no, text, bm25(passages) AS score FROM passages"
+                    " WHERE passages MATCH ? AND doc_key IN (SELECT doc_key FROM members WHERE user = ?)"
+                    " ORDER BY score LIMIT ?"
+                    ") p JOIN members m ON m.doc_key = p.doc_key AND m.user = ? ORDER BY p.score",
+                    (match, user, k, user),
+                ).fetchall()
+            event["hits"] = len(rows)
+        # FTS5 scores are negative, lower is better
+        return [
+            {"key": key, "name": name, "page": page_no, "text": text, "score": -score}
+            for key, name, page_no, text, score in rows
+        ]
+
+    def context_for(self, user, query, k=8, token_budget=1500):
+        """Joins the best passages across user's documents, each labelled with its source."""
+        selected, used = [], 0
+        for hit in self.search(user, query, k):
+            cost = count_tokens(hit["text"])
+            if used + cost > token_budget:
+                continue
+            selected.append(hit)
+            used += cost
+        # Group by document and keep page order so neighbouring passages read naturally.
+        selected.sort(key=lambda h: (h["name"], h["page"]))
+        return "\n---\n".join(f"[{h['name']}, page {h['page']}]\n{h['text']}" for h in selected)
+
+    def for_user(self, user):
+        return UserWorkspace(self, user)
+
+    def stats(self):
+        with self._connection() as conn:
+            documents, pages = conn.execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM documents").fetchone()
+            users = conn.execute("SELECT COUNT(DISTINCT user) FROM members").fetchone()[0]
+        return {"documents": documents, "pages": pages, "users": users}
+
+
+class UserWorkspace:
+    """One user's view of the shared workspace."""
+
+    def __init__(self, workspace, user):
+        self.workspace = workspace
+        self.user = user
+
+    def add(self, name, pages):
+        return self.workspace.add(self.user, name, pages)
+
+    def documents(self):
+        return self.workspace.documents(self.user)
+
+    def pages(self, key):
+        return self.workspace.pages(self.user, key)
+
+    def remove(self, key):
+        self.workspace.remove(self.user, key)
+
+    def search(self, query, k=8):
+        return self.workspace.search(self.user, query, k)
+
+    def context_for(self, query, k=8, token_budget=1500):
+        return self.workspace.context_for(self.user, query, k, token_budget)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_workspace():
+    """Returns the process-wide workspace, opening its database on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Workspace()
+        return _default